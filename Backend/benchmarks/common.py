@@ -0,0 +1,43 @@
+"""Shared setup for the benchmark scripts. Run them from Backend/, e.g. python benchmarks/name_search.py"""
+import os
+import random
+import sys
+import tempfile
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+FIRST_NAMES = ["Michael", "Jennifer", "John", "Sarah", "David", "Emily", "Robert", "Jessica", "William", "Ashley",
+               "James", "Amanda", "Daniel", "Melissa", "Matthew", "Nicole", "Li", "Wei", "Priya", "Raj", "Amir",
+               "Fatima", "Olga", "Ivan", "Chen", "Yuki"]
+LAST_NAMES = ["Johnson", "Smith", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+              "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+              "Lee", "Perez", "Thompson", "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson",
+              "Walker", "Young", "Allen", "King", "Wright", "Scott", "Torres", "Nguyen", "Hill", "Flores", "Dhillon",
+              "Singh", "MacDonald", "O'Connor"]
+
+
+def scratch_dir() -> str:
+    """Switch to a new temporary directory laid out like Backend/, so the stores write their ./clinic files there"""
+    path = tempfile.mkdtemp(prefix="clinic-bench-")
+    os.makedirs(os.path.join(path, "clinic", "records"))
+    os.chdir(path)
+    return path
+
+
+def count_arg(default: int) -> int:
+    """Return the count given as the first command line argument, or default"""
+    return int(sys.argv[1]) if len(sys.argv) > 1 else default
+
+
+def patient_rows(count: int, seed: int = 1):
+    """Yield (phn, name, birth_date, phone, email, address) rows of synthetic patients"""
+    rng = random.Random(seed)
+    for i in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        name = f"{first} {last}" if rng.random() < 0.5 else f"{first} {last}-{rng.choice(LAST_NAMES)}"
+        yield (100000000 + i, name,
+               f"{rng.randint(1930, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+               f"{rng.randint(200, 999)}{rng.randint(1000000, 9999999)}",
+               f"{first.lower()}.{last.lower()}{i}@mail.com",
+               f"{rng.randint(1, 9999)} {rng.choice(LAST_NAMES)} St")
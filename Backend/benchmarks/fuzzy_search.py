@@ -0,0 +1,63 @@
+"""Compares a similarity scan of every name with the trigram index's fuzzy name search, on names with typos.
+
+    python benchmarks/fuzzy_search.py [patients, default 1000000]
+"""
+import heapq
+import random
+import time
+from common import FIRST_NAMES, LAST_NAMES, count_arg
+from clinic.dao.patient_dao_json import PatientDAOJSON
+from clinic.dao.trigram_index import TrigramIndex
+from clinic.patient import Patient
+
+QUERIES = ["jonson", "Jhonson", "Micheal Jonson", "macdonld", "dhilon", "smiht", "priya sing"]
+THRESHOLD = 0.4
+LIMIT = 100
+
+
+def misspell(word: str, rng: random.Random) -> str:
+    """ returns the word with one letter replaced by a random one"""
+    position = rng.randrange(len(word))
+    return word[:position] + rng.choice("abcdefghijklmnopqrstuvwxyz") + word[position + 1:]
+
+
+def scan(patients: dict, name: str) -> list:
+    """ the fuzzy search without an index, the similarity of every name ranked like TrigramIndex.similar ranks it"""
+    query_trigrams = TrigramIndex.padded_trigrams(name.casefold())
+    matches = []
+    for added, patient in enumerate(patients.values()):
+        similarity = TrigramIndex.similarity(query_trigrams, patient.name.casefold())
+        if similarity >= THRESHOLD:
+            matches.append((-similarity, len(patient.name), -added, patient))
+    return [match[3] for match in heapq.nsmallest(LIMIT, matches, key=lambda match: match[:3])]
+
+
+def main() -> None:
+    count = count_arg(1000000)
+    rng = random.Random(3)
+    dao = PatientDAOJSON()
+    for phn in range(count):
+        last = rng.choice(LAST_NAMES)
+        # most names carry a typo, as names entered at a front desk do
+        name = f"{rng.choice(FIRST_NAMES)} {misspell(last, rng) if rng.random() < 0.7 else last}"
+        dao.patients[phn] = Patient(phn, name, "1990-01-01", "", "", "")
+
+    start = time.perf_counter()
+    dao.rebuild_indexes()
+    print(f"{count} patients, index built in {time.perf_counter() - start:.1f} s")
+
+    print(f"{'query':18} {'matches':>8} {'scan':>10} {'index':>10}  best match")
+    for query in QUERIES:
+        start = time.perf_counter()
+        expected = scan(dao.patients, query)
+        scan_time = time.perf_counter() - start
+        start = time.perf_counter()
+        result = dao.retrieve_patients_fuzzy(query, THRESHOLD, LIMIT)
+        index_time = time.perf_counter() - start
+        assert [p.phn for p in result] == [p.phn for p in expected], query
+        best = result[0].name if result else ""
+        print(f"{query!r:18} {len(result):8} {scan_time * 1000:8.0f} ms {index_time * 1000:8.1f} ms  {best}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Loads a running server with keep-alive clients, optionally alongside slow clients that trickle each request
+over about a second, and reports the fast clients' throughput and latency.
+
+Compare the sync views on a threaded WSGI server with the async views on an ASGI server, e.g. from Backend/:
+
+    gunicorn clinic_api.wsgi -k gthread --threads 8 -b 127.0.0.1:8000
+    uvicorn clinic_api.asgi:application --port 8001
+
+    python benchmarks/http_load.py 127.0.0.1:8000 /api/patients/search/?search=an TOKEN --slow 16
+    python benchmarks/http_load.py 127.0.0.1:8001 /api/async/patients/search/?search=an TOKEN --slow 16
+
+TOKEN is an access token from POST /api/token/.
+"""
+import argparse
+import asyncio
+import time
+
+CHUNK = 40
+CHUNK_DELAY = 0.1
+
+
+def request_bytes(host: str, path: str, token: str) -> bytes:
+    """ returns a keep-alive GET request for path"""
+    return (f"GET {path} HTTP/1.1\r\nHost: {host}\r\nAuthorization: Bearer {token}\r\n"
+            "Connection: keep-alive\r\n\r\n").encode()
+
+
+async def read_response(reader: asyncio.StreamReader) -> bool:
+    """ reads one response with a Content-Length body and returns whether its status was 200"""
+    status = await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return b" 200 " in status
+
+
+async def fast_client(host: str, port: int, request: bytes, deadline: float, latencies: list, errors: list) -> None:
+    """ sends requests back to back on one connection until deadline, recording each latency"""
+    reader, writer = await asyncio.open_connection(host, port)
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        writer.write(request)
+        await writer.drain()
+        if not await read_response(reader):
+            errors.append(1)
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+
+async def slow_client(host: str, port: int, request: bytes, deadline: float) -> None:
+    """ sends requests a few bytes at a time until deadline, like a client on a poor mobile link"""
+    reader, writer = await asyncio.open_connection(host, port)
+    while time.perf_counter() < deadline:
+        for start in range(0, len(request), CHUNK):
+            writer.write(request[start:start + CHUNK])
+            await writer.drain()
+            await asyncio.sleep(CHUNK_DELAY)
+        await read_response(reader)
+    writer.close()
+
+
+async def load(host: str, port: int, request: bytes, clients: int, slow: int, seconds: float) -> tuple:
+    """ returns the fast clients' latencies and error count"""
+    deadline = time.perf_counter() + seconds
+    latencies, errors = [], []
+    await asyncio.gather(*(fast_client(host, port, request, deadline, latencies, errors) for _ in range(clients)),
+                         *(slow_client(host, port, request, deadline) for _ in range(slow)))
+    return latencies, len(errors)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("address", help="host:port of the server")
+    parser.add_argument("path", help="path to request, including the query string")
+    parser.add_argument("token", help="JWT access token")
+    parser.add_argument("--clients", type=int, default=16, help="keep-alive clients sending requests back to back")
+    parser.add_argument("--slow", type=int, default=0, help="slow clients trickling their requests")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    host, _, port = args.address.rpartition(":")
+    request = request_bytes(host, args.path, args.token)
+    latencies, errors = asyncio.run(load(host, int(port), request, args.clients, args.slow, args.seconds))
+    latencies.sort()
+    print(f"clients={args.clients} slow={args.slow} requests/s={len(latencies) / args.seconds:.0f} "
+          f"p50={latencies[len(latencies) // 2] * 1000:.1f} ms p99={latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms "
+          f"errors={errors}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Measures with tracemalloc the memory the loaded patients, the patient store's indexes and notes take.
+
+    python benchmarks/memory.py [patients, default 100000]
+
+1000000 patients need about 4 GB of memory while measuring.
+"""
+import gc
+import time
+import tracemalloc
+from common import count_arg, patient_rows
+from clinic.dao.patient_dao_json import PatientDAOJSON
+from clinic.note import Note
+from clinic.patient import Patient
+
+
+def traced() -> int:
+    """ returns the bytes tracemalloc traces right now, after collecting garbage"""
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def main() -> None:
+    count = count_arg(100000)
+    # the field strings exist before measuring, as they would once decoded from patients.json
+    rows = list(patient_rows(count))
+    start = time.perf_counter()
+    tracemalloc.start()
+    base = traced()
+
+    patients = [Patient(*row) for row in rows]
+    del rows
+    patient_bytes = traced() - base
+
+    dao = PatientDAOJSON()
+    dao.create_patients(patients)
+    index_bytes = traced() - base - patient_bytes
+
+    # three notes for every tenth patient
+    notes = [Note(code, f"follow up visit {code}") for code in range(1, count // 10 * 3 + 1)]
+    note_bytes = traced() - base - patient_bytes - index_bytes
+    tracemalloc.stop()
+
+    print(f"{count} patients, measured in {time.perf_counter() - start:.1f} s")
+    print(f"patients          {patient_bytes / 2 ** 20:8.1f} MiB {patient_bytes / count:6.0f} B per patient")
+    print(f"store and indexes {index_bytes / 2 ** 20:8.1f} MiB {index_bytes / count:6.0f} B per patient")
+    print(f"total             {(patient_bytes + index_bytes) / 2 ** 20:8.1f} MiB "
+          f"{(patient_bytes + index_bytes) / count:6.0f} B per patient")
+    print(f"notes             {note_bytes / 2 ** 20:8.1f} MiB {note_bytes / len(notes):6.0f} B per note")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Compares the substring scan retrieve_patients used to run with the trigram name index.
+
+    python benchmarks/name_search.py [patients, default 1000000]
+"""
+import random
+import time
+from common import FIRST_NAMES, LAST_NAMES, count_arg
+from clinic.dao.patient_dao_json import PatientDAOJSON
+from clinic.patient import Patient
+
+QUERIES = ["johnson12", "dhillon999", "Li Sing", "lee", "ol", "zzz"]
+
+
+def scan(patients: dict, name: str) -> list:
+    """ the search retrieve_patients did before the index, a case-insensitive scan of every patient"""
+    result = []
+    for phn in patients:
+        patient = patients[phn]
+        if name.lower() in patient.get_name().lower():
+            result.append(patient)
+    result.reverse()
+    return result
+
+
+def main() -> None:
+    count = count_arg(1000000)
+    rng = random.Random(1)
+    dao = PatientDAOJSON()
+    for phn in range(count):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}{rng.randint(0, 999)}"
+        dao.patients[phn] = Patient(phn, name, "1990-01-01", "", "", "")
+
+    start = time.perf_counter()
+    dao.rebuild_indexes()
+    print(f"{count} patients, index built in {time.perf_counter() - start:.1f} s")
+
+    print(f"{'query':14} {'matches':>8} {'scan':>10} {'index':>10}")
+    for query in QUERIES:
+        start = time.perf_counter()
+        expected = scan(dao.patients, query)
+        scan_time = time.perf_counter() - start
+        start = time.perf_counter()
+        # the search cache would answer a repeat, so each query runs once on a cold cache
+        result = dao.retrieve_patients(query)
+        index_time = time.perf_counter() - start
+        assert [p.phn for p in result] == [p.phn for p in expected], query
+        print(f"{query!r:14} {len(result):8} {scan_time * 1000:8.1f} ms {index_time * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Compares the latency of adding a note to a large record, by full rewrite (pickle) or journal append (binary).
+
+    python benchmarks/note_append.py [appends per size, default 50]
+"""
+import time
+from common import count_arg, scratch_dir
+from clinic.dao.note_dao_binary import NoteDAOBinary
+from clinic.dao.note_dao_pickle import NoteDAOPickle
+
+RECORD_SIZES = (100, 10000, 50000)
+
+
+def append_latency(dao_class, size: int, appends: int) -> float:
+    """ returns the mean seconds to add a note to a saved record of size notes"""
+    phn = f"{dao_class.__name__}-{size}"
+    record = dao_class(phn, False)
+    for _ in range(size):
+        record.create_note("routine follow up note text " * 3)
+    record.save_notes()
+
+    record = dao_class(phn, True)
+    record.ensure_loaded()
+    start = time.perf_counter()
+    for _ in range(appends):
+        record.create_note("one line note")
+    return (time.perf_counter() - start) / appends
+
+
+def main() -> None:
+    appends = count_arg(50)
+    scratch_dir()
+    print(f"{'notes in record':>15} {'full rewrite':>14} {'journal':>10}")
+    for size in RECORD_SIZES:
+        rewrite = append_latency(NoteDAOPickle, size, appends)
+        journal = append_latency(NoteDAOBinary, size, appends)
+        print(f"{size:15} {rewrite * 1000:11.2f} ms {journal * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
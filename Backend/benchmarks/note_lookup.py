@@ -0,0 +1,49 @@
+"""Compares NoteDAOPickle's code-keyed notes with the list scans it replaced.
+
+    python benchmarks/note_lookup.py [notes, default 50000]
+
+The old list_notes re-scans the list for every code, so at 50k notes it takes tens of seconds.
+"""
+import time
+from common import count_arg, scratch_dir
+from clinic.dao.note_dao_pickle import NoteDAOPickle
+
+
+def scan_search(notes: list, key: int):
+    """ the search_note that scanned the list of notes"""
+    for note in notes:
+        if note.code == key:
+            return note
+    return None
+
+
+def scan_list(notes: list) -> list:
+    """ the list_notes that sorted the codes and searched the list for each one"""
+    codes = sorted(note.code for note in notes)
+    return [scan_search(notes, codes[i]) for i in range(len(codes) - 1, -1, -1)]
+
+
+def timed(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    count = count_arg(50000)
+    scratch_dir()
+    dao = NoteDAOPickle("benchmark", False)
+    for i in range(count):
+        dao.create_note(f"note {i}")
+    notes = list(dao.notes.values())
+    keys = range(1, count + 1, max(1, count // 1000))
+
+    print(f"{count} notes")
+    print(f"list_notes   scan {timed(scan_list, notes) * 1000:10.1f} ms   keyed {timed(dao.list_notes) * 1000:8.2f} ms")
+    scan_time = timed(lambda: [scan_search(notes, key) for key in keys]) / len(keys)
+    keyed_time = timed(lambda: [dao.search_note(key) for key in keys]) / len(keys)
+    print(f"search_note  scan {scan_time * 1e6:10.1f} us   keyed {keyed_time * 1e6:8.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, QueryDict
+from django.utils.cache import get_conditional_response
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework.request import Request
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from clinic.serializers import PatientSerializer
+from clinic.views import controller, PatientPagination, PatientCursorPagination, listing_validators, set_validators, \
+    autocomplete_limit, json_response, patient_filters
+import json
+
+
+jwt_authentication = JWTAuthentication()
+
+
+def jwt_required(view):
+    """Reject requests without a valid bearer token of an existing, active user, like JWTAuthentication and
+    IsAuthenticated do for the DRF views"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            # the user lookup queries the database, which async code must not do on the event loop
+            authenticated = await sync_to_async(jwt_authentication.authenticate)(request)
+        except AuthenticationFailed:
+            authenticated = None
+        if authenticated is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+        # the controller reuses the validated token instead of validating it again
+        request.user, request.auth = authenticated
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def conditional_listing(view):
+    """Answer a matching If-None-Match with 304 before the view reads or renders any patient"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            etag, last_modified = listing_validators(request, await controller.apatients_version(request))
+        except Exception:
+            return await view(request, *args, **kwargs)
+
+        # Last-Modified only has second precision, so only the strong ETag decides, the header is still sent
+        response = get_conditional_response(request, etag=etag, last_modified=None)
+        if response is not None:
+            return set_validators(response, etag, last_modified)
+        return set_validators(await view(request, *args, **kwargs), etag, last_modified)
+    return wrapper
+
+
+def request_data(request) -> dict:
+    """Return the JSON or form body of the request"""
+    if request.content_type == 'application/json':
+        return json.loads(request.body or b'{}')
+    if request.content_type == 'application/x-www-form-urlencoded' and request.method != 'POST':
+        # Django only parses form bodies into request.POST for POST requests
+        return QueryDict(request.body, encoding=request.encoding)
+    return request.POST
+
+
+@csrf_exempt
+@require_http_methods(['GET'])
+@jwt_required
+@conditional_listing
+async def get_patients(request):
+    """Retrieve patients with pagination, optionally by phone, email or birth date range, without holding a thread while storage is read"""
+    try:
+        filters = patient_filters(request)
+        if filters:
+            if PatientCursorPagination.cursor_query_param in request.GET:
+                raise ValueError("Phone, email and birth date filters use page numbers, not cursors.")
+            patients = await controller.afilter_patients(request, **filters)
+        elif PatientCursorPagination.cursor_query_param in request.GET:
+            paginator = PatientCursorPagination(request, key=lambda patient: patient.phn)
+            patients = await controller.alist_patients_page(request, paginator.after, paginator.page_size + 1)
+            return paginator.get_paginated_response(patients)
+        else:
+            patients = await controller.alist_patients(request)
+
+        paginator = PatientPagination()
+        paginated_patients = paginator.paginate_queryset(patients, Request(request))
+        return paginator.get_fragment_response(paginated_patients)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
+@csrf_exempt
+@require_http_methods(['GET'])
+@jwt_required
+@conditional_listing
+async def search_patients(request):
+    """Search patients by name with pagination, by substring or with mode=fuzzy by similarity, without holding a thread while storage is read"""
+    try:
+        search_query = request.GET.get('search', '')
+        mode = request.GET.get('mode', 'substring')
+        if mode not in ('substring', 'fuzzy'):
+            raise ValueError(f"Unknown search mode: {mode}")
+        if mode == 'fuzzy':
+            # ranked by similarity, so only page numbers apply
+            patients = await controller.aretrieve_patients_fuzzy(request, search_query)
+        elif PatientCursorPagination.cursor_query_param in request.GET:
+            paginator = PatientCursorPagination(request, key=lambda patient: [patient.name.casefold(), patient.phn])
+            patients = await controller.aretrieve_patients_page(request, search_query, paginator.after, paginator.page_size + 1)
+            return paginator.get_paginated_response(patients)
+        else:
+            patients = await controller.aretrieve_patients(request, search_query)
+
+        paginator = PatientPagination()
+        paginated_patients = paginator.paginate_queryset(patients, Request(request))
+        return paginator.get_fragment_response(paginated_patients)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
+@csrf_exempt
+@require_http_methods(['GET'])
+@jwt_required
+@conditional_listing
+async def autocomplete_patients(request):
+    """Suggest patients whose name starts with the typed prefix, without holding a thread while storage is read"""
+    try:
+        prefix = request.GET.get('prefix', '')
+        patients = await controller.aautocomplete(request, prefix, autocomplete_limit(request))
+        return json_response({'prefix': prefix}, patients)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+@jwt_required
+async def create_patient(request):
+    """Create a new patient, without holding a thread while it is written"""
+    try:
+        data = request_data(request)
+        phn = int(data.get("phn"))
+        name = data.get("name")
+        birth_date = data.get("birthDate")
+        phone = data.get("phone")
+        email = data.get("email")
+        address = data.get("address")
+
+        patient = await controller.acreate_patient(request, phn, name, birth_date, phone, email, address)
+
+        serializer = PatientSerializer(patient)
+        return JsonResponse({"message": "Patient created successfully", "patient": serializer.data}, status=status.HTTP_201_CREATED)
+
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@csrf_exempt
+@require_http_methods(['PUT'])
+@jwt_required
+async def update_patient(request, original_phn):
+    """Update an existing patient, without holding a thread while it is written"""
+    try:
+        data = request_data(request)
+        phn = data.get("phn")
+        name = data.get("name")
+        birth_date = data.get("birth_date")
+        phone = data.get("phone")
+        email = data.get("email")
+        address = data.get("address")
+
+        if not all([phn, name, birth_date, phone, email, address]):
+            return JsonResponse({"error": "All fields are required."}, status=405)
+
+        success = await controller.aupdate_patient(
+            request,
+            original_phn=int(original_phn),
+            phn=int(phn),
+            name=name,
+            birth_date=birth_date,
+            phone=phone,
+            email=email,
+            address=address
+        )
+
+        if success:
+            return JsonResponse({"message": "Patient updated successfully."}, status=200)
+        else:
+            return JsonResponse({"error": "Failed to update patient."}, status=400)
+
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=401)
+
+
+@csrf_exempt
+@require_http_methods(['DELETE'])
+@jwt_required
+async def delete_patient(request, phn):
+    """Delete a patient by PHN, without holding a thread while it is written"""
+    try:
+        success = await controller.adelete_patient(request, phn)
+        if success:
+            return JsonResponse({'message': 'Patient deleted successfully'}, status=200)
+        return JsonResponse({'error': 'Patient not found'}, status=404)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
@@ -1,8 +1,16 @@
+import atexit
+from concurrent.futures import ThreadPoolExecutor
 from django.contrib.auth import authenticate
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.exceptions import ValidationError
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import Token
+from rest_framework_simplejwt.settings import api_settings
 from clinic.patient import Patient
 from clinic.note import Note
+from clinic.serializers import PatientSerializer
+from clinic.patient_export import iter_records
 from clinic.exception.invalid_login_exception import InvalidLoginException
 from clinic.exception.duplicate_login_exception import DuplicateLoginException
 from clinic.exception.invalid_logout_exception import InvalidLogoutException
@@ -10,12 +18,72 @@ from clinic.exception.illegal_access_exception import IllegalAccessException
 from clinic.exception.illegal_operation_exception import IllegalOperationException
 from clinic.exception.no_current_patient_exception import NoCurrentPatientException
 from clinic.dao.patient_dao_json import PatientDAOJSON
+from clinic.dao.patient_dao_sqlite import PatientDAOSQLite
+from clinic.dao.sqlite_database import SQLiteDatabase
+from clinic.dao.patient_dao_executor import PatientDAOExecutor
+from clinic.dao.patient_keys import email_key
+from clinic.dao.write_behind_flusher import WriteBehindFlusher
+from clinic.dao.note_store_cache import NoteStoreCache
+from clinic.dao.session_store_memory import SessionStoreMemory
+from clinic.dao.session_store_sqlite import SessionStoreSQLite
+from clinic.token_cache import TokenCache
 
 class Controller:
-    def __init__(self, autosave=False) -> None:
+    def __init__(self, autosave=False, journal=False, write_behind=False, note_store_capacity=256, max_resident_notes=None,
+                 backend="json", database_path="./clinic/clinic.sqlite3",
+                 session_backend="memory", session_path="./clinic/sessions.sqlite3", session_ttl=8 * 60 * 60,
+                 async_workers=8, search_cache_capacity=256, search_cache_max_keys=1000000) -> None:
         self.autosave = autosave
-        self._patient_dao_json = PatientDAOJSON(self.autosave)
-        self._patient = None
+        self._flusher = WriteBehindFlusher() if write_behind else None
+        self._note_stores = NoteStoreCache(note_store_capacity, max_resident_notes)
+        self._database = None
+        self._jwt_authentication = JWTAuthentication()
+        self._token_cache = TokenCache()
+
+        if backend == "json":
+            self._patient_dao = PatientDAOJSON(self.autosave, journal, flusher=self._flusher, note_stores=self._note_stores,
+                                              search_cache_capacity=search_cache_capacity,
+                                              search_cache_max_keys=search_cache_max_keys)
+        elif backend == "sqlite":
+            self._database = SQLiteDatabase(database_path)
+            self._patient_dao = PatientDAOSQLite(self._database)
+        else:
+            raise ImproperlyConfigured(f"Unknown clinic storage backend: {backend}")
+
+        if session_backend == "memory":
+            self._sessions = SessionStoreMemory(session_ttl)
+        elif session_backend == "sqlite":
+            self._sessions = SessionStoreSQLite(session_path, session_ttl)
+        else:
+            raise ImproperlyConfigured(f"Unknown clinic session backend: {session_backend}")
+
+        # async views hand blocking persistence to this pool, its size bounds the DAO calls in flight
+        self._executor = ThreadPoolExecutor(max_workers=async_workers, thread_name_prefix="clinic-dao")
+        self._async_patient_dao = PatientDAOExecutor(self._patient_dao, self._executor)
+
+        if self._flusher:
+            atexit.register(self.close)
+
+    def close(self) -> None:
+        """ waits for async DAO calls in flight and writes out any changes still held by the write-behind flusher"""
+        self._executor.shutdown(wait=True)
+        if self._flusher:
+            self._flusher.close()
+
+    def note_store_stats(self, request) -> dict:
+        """ Returns note store cache counters if logged in """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        return self._note_stores.stats()
+
+    def search_cache_stats(self, request) -> dict:
+        """ Returns patient search cache counters if logged in, empty for backends that search without one """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        search_cache = getattr(self._patient_dao, "search_cache", None)
+        return search_cache.stats() if search_cache is not None else {}
 
     def login(self, request, username: str, password: str) -> dict:
         """Authenticate user and return JWT token"""
@@ -30,17 +98,39 @@ class Controller:
             raise InvalidLoginException("Invalid username or password")
 
     def is_logged(self, request) -> bool:
-        """ Check if user is authenticated using JWT """
-        auth = JWTAuthentication()
+        """ Check if user is authenticated using JWT, validating the token at most once per request """
+        if not hasattr(request, '_clinic_user_id'):
+            request._clinic_user_id = self._validate_token(request)
+        return request._clinic_user_id is not None
+
+    def _user_id(self, request):
+        """ Returns the id of the user whose token authenticated the request """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        return request._clinic_user_id
+
+    def _validate_token(self, request):
+        """ Validates the bearer token and returns its user id, reusing DRF's validation and earlier validations of the same token """
         try:
             auth_header = request.headers.get('Authorization')
             if auth_header and auth_header.startswith("Bearer "):
                 token = auth_header.split()[1]
-                auth.get_validated_token(token)
-                return True
+                user_id = self._token_cache.get_user_id(token)
+                if user_id is not None:
+                    return user_id
+
+                # DRF's JWTAuthentication has usually validated this token already
+                validated = getattr(request, 'auth', None)
+                if not isinstance(validated, Token) or validated.token not in (token, token.encode()):
+                    validated = self._jwt_authentication.get_validated_token(token)
+
+                user_id = validated[api_settings.USER_ID_CLAIM]
+                self._token_cache.add(token, validated['exp'], user_id)
+                return user_id
         except Exception:
-            return False
-        return False
+            return None
+        return None
 
     def logout(self, request) -> bool:
         """Blacklist the refresh token to log out"""
@@ -57,26 +147,127 @@ class Controller:
         if not self.is_logged(request):
             raise IllegalAccessException()
 
-        if self._patient_dao_json.search_patient(phn):
+        if self._patient_dao.search_patient(phn):
             raise IllegalOperationException("Patient with this PHN already exists.")
 
-        patient = Patient(phn, name, birth_date, phone, email, address, self.autosave)
-        self._patient_dao_json.create_patient(patient)
+        patient = Patient(phn, name, birth_date, phone, email, address, self.autosave, self._flusher, self._note_stores, self._database)
+        self._patient_dao.create_patient(patient)
         return patient
 
+    def import_patients(self, request, rows, max_errors: int = 1000) -> dict:
+        """ Validates (line, row) pairs as they stream in and creates the valid patients with one write if logged in """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        validator = PatientSerializer()
+        patients = []
+        phns = set()
+        errors = []
+        failed = 0
+        for line, row in rows:
+            if row is None:
+                error = {"non_field_errors": ["Expected a JSON object."]}
+            else:
+                try:
+                    data = validator.run_validation(row)
+                    error = None
+                except ValidationError as e:
+                    error = e.detail
+
+            if error is None and (data["phn"] in phns or self._patient_dao.search_patient(data["phn"])):
+                error = {"phn": ["Patient with this PHN already exists."]}
+
+            if error is not None:
+                failed += 1
+                if len(errors) < max_errors:
+                    errors.append({"line": line, "errors": error})
+                continue
+
+            phns.add(data["phn"])
+            patients.append(Patient(data["phn"], data["name"], data["birth_date"], data["phone"], data["email"], data["address"],
+                                    self.autosave, self._flusher, self._note_stores, self._database))
+
+        if patients:
+            self._patient_dao.create_patients(patients)
+
+        return {"created": len(patients), "failed": failed, "errors": errors}
+
+    def export_records(self, request):
+        """ Returns a lazy iterator over every patient and note as export records if logged in """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        return iter_records(self._patient_dao)
+
     def search_patient(self, request, phn: int) -> Patient:
         """ Returns a patient by PHN if logged in """
         if not self.is_logged(request):
             raise IllegalAccessException()
 
-        return self._patient_dao_json.search_patient(phn)
+        return self._patient_dao.search_patient(phn)
 
     def retrieve_patients(self, request, name: str) -> list:
         """Returns a list of patients with a matching name if logged in"""
         if not self.is_logged(request):
             raise IllegalAccessException()
 
-        return self._patient_dao_json.retrieve_patients(name)
+        return self._patient_dao.retrieve_patients(name)
+
+    def retrieve_patients_fuzzy(self, request, name: str) -> list:
+        """ Returns the patients whose name is most similar to the given one, tolerating typos, if logged in """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        return self._patient_dao.retrieve_patients_fuzzy(name)
+
+    def retrieve_patients_by_phone(self, request, phone: str) -> list:
+        """ Returns the patients with the given phone number, however it is formatted, if logged in """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        return self._patient_dao.retrieve_patients_by_phone(phone)
+
+    def retrieve_patients_by_email(self, request, email: str) -> list:
+        """ Returns the patients with the given email address, in any case, if logged in """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        return self._patient_dao.retrieve_patients_by_email(email)
+
+    def retrieve_patients_born_between(self, request, after: str = None, before: str = None) -> list:
+        """ Returns the patients born between the given ISO dates inclusive, in birth date order, if logged in """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        return self._patient_dao.retrieve_patients_born_between(after, before)
+
+    def filter_patients(self, request, phone: str = None, email: str = None,
+                        birth_date_after: str = None, birth_date_before: str = None) -> list:
+        """ Returns the patients matching every given phone, email and birth date bound, if logged in """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        return self._filter_patients(phone, email, birth_date_after, birth_date_before)
+
+    def _filter_patients(self, phone: str, email: str, birth_date_after: str, birth_date_before: str) -> list:
+        """ looks up the most selective condition in its index and checks the others on the few patients found """
+        if phone is not None:
+            patients = self._patient_dao.retrieve_patients_by_phone(phone)
+        elif email is not None:
+            patients = self._patient_dao.retrieve_patients_by_email(email)
+        else:
+            return self._patient_dao.retrieve_patients_born_between(birth_date_after, birth_date_before)
+
+        if email is not None:
+            patients = [patient for patient in patients if email_key(patient.email) == email_key(email)]
+        if birth_date_after is not None or birth_date_before is not None:
+            # undated patients are in no birth date range, as in retrieve_patients_born_between
+            patients = [patient for patient in patients if patient.birth_date]
+        if birth_date_after is not None:
+            patients = [patient for patient in patients if patient.birth_date >= birth_date_after]
+        if birth_date_before is not None:
+            patients = [patient for patient in patients if patient.birth_date <= birth_date_before]
+        return patients
 
     def update_patient(self, request, original_phn: int, phn: int, name: str, birth_date: str, phone: str, email: str, address: str) -> bool:
         """ Updates patient data if logged in """
@@ -87,77 +278,215 @@ class Controller:
         if patient is None:
             raise IllegalOperationException("Patient not found.")
 
-        new_patient = Patient(phn, name, birth_date, phone, email, address, self.autosave)
+        new_patient = Patient(phn, name, birth_date, phone, email, address, self.autosave, self._flusher, self._note_stores, self._database)
 
         if original_phn == phn:
-            self._patient_dao_json.update_patient(original_phn, new_patient)
+            self._patient_dao.update_patient(original_phn, new_patient)
             return True
 
-        if self._patient_dao_json.search_patient(phn):
+        if self._patient_dao.search_patient(phn):
             raise IllegalOperationException("New PHN is already in use.")
 
-        self._patient_dao_json.delete_patient(original_phn)
-        self._patient_dao_json.create_patient(new_patient)
+        self._patient_dao.delete_patient(original_phn)
+        self._patient_dao.create_patient(new_patient)
+        self._follow_phn_change(request, original_phn, phn)
         return True
 
+    def _follow_phn_change(self, request, original_phn: int, phn: int) -> None:
+        """ keeps the caller's current patient when its PHN changes"""
+        user_id = self._user_id(request)
+        if self._sessions.get_current_patient(user_id) == original_phn:
+            self._sessions.set_current_patient(user_id, phn)
+
     def delete_patient(self, request, phn: int) -> bool:
         """ Deletes a patient if logged in """
         if not self.is_logged(request):
             raise IllegalAccessException()
 
-        patient = self._patient_dao_json.search_patient(phn)
+        patient = self._patient_dao.search_patient(phn)
         if patient is None:
             return False
 
-        return self._patient_dao_json.delete_patient(phn)
+        return self._patient_dao.delete_patient(phn)
 
     def list_patients(self, request) -> list:
         """ Returns a list of all patients if logged in """
         if not self.is_logged(request):
             raise IllegalAccessException()
 
-        return self._patient_dao_json.list_patients()
+        return self._patient_dao.list_patients()
+
+    def autocomplete(self, request, prefix: str, limit: int = 10) -> list:
+        """ Returns up to limit patients whose name starts with the prefix, in name order, if logged in """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        return self._patient_dao.autocomplete(prefix, limit)
+
+    def patients_version(self, request) -> tuple:
+        """ Returns a token that changes whenever the patients change, and the time they last changed, if logged in """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        return self._patient_dao.version()
+
+    def list_patients_page(self, request, after_phn: int = None, limit: int = 100) -> list:
+        """ Returns up to limit patients after the given PHN, in PHN order, if logged in """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        return self._patient_dao.list_patients_page(after_phn, limit)
+
+    def retrieve_patients_page(self, request, name: str, after: tuple = None, limit: int = 100) -> list:
+        """ Returns up to limit patients matching the name after the given name key, in name order, if logged in """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        return self._patient_dao.retrieve_patients_page(name, after, limit)
+
+    async def acreate_patient(self, request, phn: int, name: str, birth_date: str, phone: str, email: str, address: str) -> Patient:
+        """ Creates and returns a new patient if logged in, without blocking the event loop """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        if await self._async_patient_dao.search_patient(phn):
+            raise IllegalOperationException("Patient with this PHN already exists.")
+
+        patient = Patient(phn, name, birth_date, phone, email, address, self.autosave, self._flusher, self._note_stores, self._database)
+        await self._async_patient_dao.create_patient(patient)
+        return patient
+
+    async def aretrieve_patients(self, request, name: str) -> list:
+        """ Returns a list of patients with a matching name if logged in, without blocking the event loop """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        return await self._async_patient_dao.retrieve_patients(name)
+
+    async def aretrieve_patients_fuzzy(self, request, name: str) -> list:
+        """ Returns the patients whose name is most similar to the given one, tolerating typos, if logged in """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        return await self._async_patient_dao.retrieve_patients_fuzzy(name)
+
+    async def afilter_patients(self, request, phone: str = None, email: str = None,
+                               birth_date_after: str = None, birth_date_before: str = None) -> list:
+        """ Returns the patients matching every given phone, email and birth date bound, if logged in """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        return await self._async_patient_dao.run(self._filter_patients, phone, email, birth_date_after, birth_date_before)
+
+    async def aupdate_patient(self, request, original_phn: int, phn: int, name: str, birth_date: str, phone: str, email: str, address: str) -> bool:
+        """ Updates patient data if logged in, without blocking the event loop """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        patient = await self._async_patient_dao.search_patient(original_phn)
+        if patient is None:
+            raise IllegalOperationException("Patient not found.")
+
+        new_patient = Patient(phn, name, birth_date, phone, email, address, self.autosave, self._flusher, self._note_stores, self._database)
+
+        if original_phn == phn:
+            await self._async_patient_dao.update_patient(original_phn, new_patient)
+            return True
+
+        if await self._async_patient_dao.search_patient(phn):
+            raise IllegalOperationException("New PHN is already in use.")
+
+        await self._async_patient_dao.delete_patient(original_phn)
+        await self._async_patient_dao.create_patient(new_patient)
+        await self._async_patient_dao.run(self._follow_phn_change, request, original_phn, phn)
+        return True
+
+    async def adelete_patient(self, request, phn: int) -> bool:
+        """ Deletes a patient if logged in, without blocking the event loop """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        patient = await self._async_patient_dao.search_patient(phn)
+        if patient is None:
+            return False
+
+        return await self._async_patient_dao.delete_patient(phn)
+
+    async def alist_patients(self, request) -> list:
+        """ Returns a list of all patients if logged in, without blocking the event loop """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        return await self._async_patient_dao.list_patients()
+
+    async def aautocomplete(self, request, prefix: str, limit: int = 10) -> list:
+        """ Returns up to limit patients whose name starts with the prefix, in name order, if logged in """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        return await self._async_patient_dao.autocomplete(prefix, limit)
+
+    async def apatients_version(self, request) -> tuple:
+        """ Returns a token that changes whenever the patients change, and the time they last changed, if logged in """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        return await self._async_patient_dao.version()
+
+    async def alist_patients_page(self, request, after_phn: int = None, limit: int = 100) -> list:
+        """ Returns up to limit patients after the given PHN if logged in, without blocking the event loop """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        return await self._async_patient_dao.list_patients_page(after_phn, limit)
+
+    async def aretrieve_patients_page(self, request, name: str, after: tuple = None, limit: int = 100) -> list:
+        """ Returns up to limit patients matching the name after the given name key if logged in, without blocking the event loop """
+        if not self.is_logged(request):
+            raise IllegalAccessException()
+
+        return await self._async_patient_dao.retrieve_patients_page(name, after, limit)
 
     def set_current_patient(self, request, phn: int) -> None:
         """Sets the current patient if logged in"""
         if not self.is_logged(request):
             raise IllegalAccessException()
 
-        patient = self._patient_dao_json.search_patient(phn)
+        patient = self._patient_dao.search_patient(phn)
         if patient is None:
             raise IllegalOperationException("Patient not found.")
 
-        self._patient = patient
+        self._sessions.set_current_patient(self._user_id(request), phn)
 
     def get_current_patient(self, request) -> Patient:
-        """Returns the current patient if logged in"""
+        """Returns the current patient of the logged in user"""
         if not self.is_logged(request):
             raise IllegalAccessException()
 
-        if self._patient is None:
+        phn = self._sessions.get_current_patient(self._user_id(request))
+        patient = self._patient_dao.search_patient(phn) if phn is not None else None
+        if patient is None:
             raise NoCurrentPatientException("No current patient selected.")
 
-        return self._patient
+        return patient
 
     def unset_current_patient(self, request) -> None:
-        """Unsets the current patient"""
+        """Unsets the current patient of the logged in user"""
         if not self.is_logged(request):
             raise IllegalAccessException()
 
-        self._patient = None
+        self._sessions.unset_current_patient(self._user_id(request))
 
     def create_note(self, request, note: str) -> Note:
         """ Creates a patient note if logged in """
         if not self.is_logged(request):
             raise IllegalAccessException()
 
-        if self._patient is None:
-            raise NoCurrentPatientException("No current patient selected.")
-
+        patient = self.get_current_patient(request)
         if not note.strip():
             raise IllegalOperationException("Note text cannot be empty.")
 
-        note_record = self._patient.get_patient_records().add_note(note)
+        note_record = patient.get_patient_records().add_note(note)
         return note_record
 
     def search_note(self, request, note_id: int) -> Note:
@@ -165,50 +494,40 @@ class Controller:
         if not self.is_logged(request):
             raise IllegalAccessException()
 
-        if self._patient is None:
-            raise NoCurrentPatientException("No current patient selected.")
-
-        return self._patient.get_patient_records().get_note_by_id(note_id)
+        patient = self.get_current_patient(request)
+        return patient.get_patient_records().get_note_by_id(note_id)
 
-    def retrieve_notes(self, request, text: str) -> list:
+    def retrieve_notes(self, request, text: str, limit: int = None) -> list:
         """ Returns a list of patient notes if logged in """
         if not self.is_logged(request):
             raise IllegalAccessException()
 
-        if self._patient is None:
-            raise NoCurrentPatientException("No current patient selected.")
-
-        return self._patient.get_patient_records().get_notes_by_text(text)
+        patient = self.get_current_patient(request)
+        return patient.get_patient_records().get_notes_by_text(text, limit)
 
     def update_note(self, request, note_id: int, note: str) -> bool:
         """ Updates a patient note if logged in """
         if not self.is_logged(request):
             raise IllegalAccessException()
 
-        if self._patient is None:
-            raise NoCurrentPatientException("No current patient selected.")
-
-        return self._patient.get_patient_records().update_note(note_id, note)
+        patient = self.get_current_patient(request)
+        return patient.get_patient_records().update_note(note_id, note)
 
     def delete_note(self, request, note_id: int) -> bool:
         """ Deletes a patient note if logged in """
         if not self.is_logged(request):
             raise IllegalAccessException()
 
-        if self._patient is None:
-            raise NoCurrentPatientException("No current patient selected.")
-
-        return self._patient.get_patient_records().delete_patient_note(note_id)
+        patient = self.get_current_patient(request)
+        return patient.get_patient_records().delete_patient_note(note_id)
 
     def list_notes(self, request) -> list:
         """ Returns all patient notes if logged in """
         if not self.is_logged(request):
             raise IllegalAccessException()
 
-        if self._patient is None:
-            raise NoCurrentPatientException("No current patient selected.")
-
-        notes = self._patient.get_patient_records().get_notes_list()
+        patient = self.get_current_patient(request)
+        notes = patient.get_patient_records().get_notes_list()
         if not notes:
             raise IllegalOperationException("No notes found.")
 
@@ -0,0 +1,61 @@
+from abc import ABC, abstractmethod
+
+
+class AsyncPatientDAO(ABC):
+    """ PatientDAO for async callers, every method is a coroutine"""
+
+    @abstractmethod
+    async def search_patient(self, key):
+        pass
+
+    @abstractmethod
+    async def create_patient(self, patient):
+        pass
+
+    @abstractmethod
+    async def retrieve_patients(self, search_string):
+        pass
+
+    @abstractmethod
+    async def update_patient(self, key, patient):
+        pass
+
+    @abstractmethod
+    async def delete_patient(self, key):
+        pass
+
+    @abstractmethod
+    async def list_patients(self):
+        pass
+
+    @abstractmethod
+    async def list_patients_page(self, after_phn = None, limit = 100):
+        pass
+
+    @abstractmethod
+    async def retrieve_patients_page(self, name, after = None, limit = 100):
+        pass
+
+    @abstractmethod
+    async def retrieve_patients_fuzzy(self, name, threshold = 0.4, limit = 100):
+        pass
+
+    @abstractmethod
+    async def retrieve_patients_by_phone(self, phone):
+        pass
+
+    @abstractmethod
+    async def retrieve_patients_by_email(self, email):
+        pass
+
+    @abstractmethod
+    async def retrieve_patients_born_between(self, after = None, before = None):
+        pass
+
+    @abstractmethod
+    async def autocomplete(self, prefix, limit = 10):
+        pass
+
+    @abstractmethod
+    async def version(self):
+        pass
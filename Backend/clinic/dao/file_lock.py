@@ -0,0 +1,103 @@
+import os
+import struct
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory locks on this platform, the lock then only serializes threads of one process
+    fcntl = None
+
+
+GENERATION = struct.Struct("<Q")
+
+
+class FileLock:
+    """ exclusive advisory lock on a lock file, shared by every process that uses the same path
+    and reentrant within a thread. The lock file also holds a counter writers bump after each write."""
+
+    def __init__(self, filepath: str) -> None:
+        self.filepath = filepath
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+        self._owner = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                fd = os.open(self.filepath, os.O_RDWR | os.O_CREAT, 0o644)
+            except BaseException:
+                self._thread_lock.release()
+                raise
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except BaseException:
+                os.close(fd)
+                self._thread_lock.release()
+                raise
+            self._fd = fd
+        self._owner = threading.get_ident()
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            # the file stays open only while locked so idle stores do not hold descriptors
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        if self._depth == 0:
+            self._owner = None
+        self._thread_lock.release()
+
+
+    def generation(self) -> int:
+        """ returns the write counter, 0 if nothing was written yet"""
+        fd = self._owned_fd()
+        if fd is not None:
+            return self._read_generation(fd)
+        try:
+            fd = os.open(self.filepath, os.O_RDONLY)
+        except FileNotFoundError:
+            return 0
+        try:
+            return self._read_generation(fd)
+        finally:
+            os.close(fd)
+
+    def bump(self) -> None:
+        """ increments the write counter, call it after writing while holding the lock"""
+        generation = GENERATION.pack(self.generation() + 1)
+        fd = self._owned_fd()
+        if fd is not None:
+            os.pwrite(fd, generation, 0)
+            return
+        fd = os.open(self.filepath, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.pwrite(fd, generation, 0)
+        finally:
+            os.close(fd)
+
+    def signature(self, *filepaths: str) -> tuple:
+        """ returns the write counter followed by (inode, size, mtime) of each file, or None for a missing one.
+        File times alone are too coarse to tell two quick writes apart, the counter is not."""
+        signature = [self.generation()]
+        for filepath in filepaths:
+            try:
+                stat = os.stat(filepath)
+                signature.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _owned_fd(self):
+        """ returns the open lock file if the calling thread holds the lock, other threads must open their own"""
+        return self._fd if self._owner == threading.get_ident() else None
+
+    @staticmethod
+    def _read_generation(fd: int) -> int:
+        data = os.pread(fd, GENERATION.size, 0)
+        return GENERATION.unpack(data)[0] if len(data) == GENERATION.size else 0
@@ -7,7 +7,7 @@ class NoteDAO(ABC):
     def create_note(self, text):
         pass
     @abstractmethod
-    def retrieve_notes(self, search_string):
+    def retrieve_notes(self, search_string, limit=None):
         pass
     @abstractmethod
     def update_note(self, key, text):
@@ -0,0 +1,148 @@
+import os
+import pickle
+from clinic.dao.note_dao_pickle import NoteDAOPickle
+from clinic.dao.file_lock import FileLock
+from clinic.dao.note_file import NoteFileReader, write_notes, append_journal, read_journal, PUT, TOMBSTONE
+from clinic.note import Note
+
+
+class NoteDAOBinary(NoteDAOPickle):
+    # fold the journal into the snapshot once this share of all records is superseded or deleted
+    compact_ratio = 0.5
+    compact_min_records = 64
+
+    def __init__(self, phn: str, autosave: False, flusher = None, note_stores = None):
+        super().__init__(phn, autosave, flusher, note_stores)
+        # records written before the binary format, read until a snapshot replaces them, see migrate_notes
+        self.legacy_filepath = self.filepath
+        self.filepath = f'./clinic/records/{self.phn}.bin'
+        self.journal_filepath = f'./clinic/records/{self.phn}.log'
+        if autosave:
+            self._file_lock = FileLock(self.filepath + '.lock')
+        self._snapshot_records = 0
+        self._journal_records = 0
+        self._dead_records = 0
+
+    def read_notes(self) -> [Note]:
+        """ returns the notes of the binary snapshot, or of the legacy pickle file if there is none yet, with the journal replayed over them"""
+        notes = {}
+        try:
+            with NoteFileReader(self.filepath) as reader:
+                for note in reader:
+                    notes[note.code] = note
+        except FileNotFoundError:
+            for note in self.read_legacy_notes():
+                notes[note.code] = note
+
+        records = read_journal(self.journal_filepath)
+        self._snapshot_records = len(notes)
+        self._journal_records = len(records)
+        self._dead_records = 0
+        for op, note in records:
+            superseded = notes.pop(note.code, None)
+            if superseded is not None:
+                self._dead_records += 1
+            if op == PUT:
+                notes[note.code] = note
+            else:
+                self._dead_records += 1
+
+        return list(notes.values())
+
+    def read_legacy_notes(self) -> [Note]:
+        """ returns the notes of the pickle file the record had before the binary format, empty if there is none"""
+        try:
+            with open(self.legacy_filepath, 'rb') as file:
+                return pickle.load(file)
+        except (FileNotFoundError, EOFError):
+            return []
+
+    def file_signature(self) -> tuple:
+        """ returns the write counter and the signature of the snapshot and journal files"""
+        return self._file_lock.signature(self.filepath, self.journal_filepath)
+
+    def write_notes(self, notes: [Note]) -> None:
+        """ writes the notes to the binary note file, replacing it atomically"""
+        write_notes(self.filepath, notes)
+
+    def commit(self, op: str, note: Note) -> None:
+        """ appends a record for the change to the patient's note journal"""
+        if not self.autosave:
+            return
+
+        # callers hold the write lock and the file lock, see NoteDAOPickle.writing
+        append_journal(self.journal_filepath, TOMBSTONE if op == "delete" else PUT, note)
+        self._journal_records += 1
+        if op == "update":
+            self._dead_records += 1
+        elif op == "delete":
+            self._dead_records += 2
+        self._file_lock.bump()
+        self._signature = self.file_signature()
+
+        if self.needs_compaction():
+            if self.flusher:
+                self.flusher.mark_dirty(self.journal_filepath, self.compact_journal)
+            else:
+                self.compact_journal()
+
+    def needs_compaction(self) -> bool:
+        """ returns true if enough journal records are superseded or deleted to be worth a new snapshot"""
+        total = self._snapshot_records + self._journal_records
+        return (self._journal_records >= self.compact_min_records
+                and self._dead_records >= self.compact_ratio * total)
+
+    def compact_journal(self) -> None:
+        """ folds the journal into a new snapshot and empties the journal"""
+        with self._lock.write(), self._file_lock:
+            if not self._loaded:
+                return
+            if self.is_stale():
+                # another process appended records this one has not seen, they belong in the snapshot too
+                self.load_notes()
+
+            notes = list(self.notes.values())
+            write_notes(self.filepath, notes)
+            with open(self.journal_filepath, 'wb') as file:
+                file.flush()
+                os.fsync(file.fileno())
+
+            self._snapshot_records = len(notes)
+            self._journal_records = 0
+            self._dead_records = 0
+            self._file_lock.bump()
+            self._signature = self.file_signature()
+
+    def search_note(self, key: int) -> Note:
+        """ returns note by given id, reading only that note from disk if the notes are not loaded"""
+        if self._loaded or self._journal_size() > 0:
+            return super().search_note(key)
+
+        try:
+            with NoteFileReader(self.filepath) as reader:
+                return reader.read_note(key)
+        except FileNotFoundError:
+            # no snapshot yet, the notes may still be in the legacy pickle file
+            return super().search_note(key)
+
+    def iter_notes(self):
+        """ yields the notes in code order, straight from the mapped snapshot when there is no journal to replay"""
+        if self._loaded or self._journal_size() > 0:
+            yield from super().iter_notes()
+            return
+
+        try:
+            reader = NoteFileReader(self.filepath)
+        except FileNotFoundError:
+            # no snapshot yet, the notes may still be in the legacy pickle file
+            yield from super().iter_notes()
+            return
+        with reader:
+            yield from reader
+
+    def _journal_size(self) -> int:
+        """ returns the size of the journal in bytes"""
+        try:
+            return os.path.getsize(self.journal_filepath)
+        except FileNotFoundError:
+            return 0
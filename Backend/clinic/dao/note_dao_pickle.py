@@ -1,95 +1,213 @@
 from clinic.dao.note_dao import NoteDAO
+from clinic.dao.note_text_index import NoteTextIndex
+from clinic.dao.file_lock import FileLock
+from clinic.dao.rw_lock import ReadWriteLock
 from clinic.note import Note
+from contextlib import contextmanager, nullcontext
+import os
 import pickle
 
 class NoteDAOPickle(NoteDAO):
-    def __init__(self, phn: str, autosave: False):
+    def __init__(self, phn: str, autosave: False, flusher = None, note_stores = None):
         self.autosave = autosave
+        self.flusher = flusher
+        self.note_stores = note_stores
         self.phn = phn
         self.auto_counter = 0
-        self.notes = []
+        # codes only ever grow, so insertion order is ascending code order
+        self.notes = {}
         self.filepath =  f'./clinic/records/{self.phn}.dat'
-
-        if autosave:
-            self.load_notes()
+        self._text_index = NoteTextIndex()
+        # notes are read from disk on first access, see ensure_loaded
+        self._loaded = not autosave
+        self._dirty = False
+        # writers hold the lock across processes, readers compare the signature to notice their writes
+        self._file_lock = FileLock(self.filepath + '.lock') if autosave else nullcontext()
+        self._signature = None
+        # searches and listings share the notes, mutations, loads and unloads take them exclusively
+        self._lock = ReadWriteLock()
+
+    def is_loaded(self) -> bool:
+        """ returns true if the notes are in memory"""
+        return self._loaded
+
+    def ensure_loaded(self) -> None:
+        """ loads the notes from disk unless that already happened, or reloads them if another process changed them"""
+        self.load_if_stale()
+        if self.note_stores and self.autosave:
+            self.note_stores.touch(self)
+
+    def load_if_stale(self) -> None:
+        """ loads the notes unless the ones in memory are current"""
+        if not self._loaded or self.is_stale():
+            with self._lock.write(), self._file_lock:
+                if not self._loaded or self.is_stale():
+                    self.load_notes()
+
+    @contextmanager
+    def reading(self):
+        """ holds the read lock over loaded notes"""
+        while True:
+            self.ensure_loaded()
+            with self._lock.read():
+                # the note store cache may have unloaded them before the lock was taken
+                if self._loaded:
+                    yield
+                    return
+
+    @contextmanager
+    def writing(self):
+        """ holds the write lock and the file lock over current notes"""
+        # loading first, outside the locks, keeps cache evictions of other stores out of the locked section
+        self.ensure_loaded()
+        with self._lock.write(), self._file_lock:
+            self.load_if_stale()
+            yield
+
+    def is_stale(self) -> bool:
+        """ returns true if another process wrote the note files since they were loaded or written here"""
+        # unflushed changes win, a deferred write is only safe with a single writer process
+        return self.autosave and not self._dirty and self.file_signature() != self._signature
+
+    def file_signature(self) -> tuple:
+        """ returns the write counter and the signature of the note file"""
+        return self._file_lock.signature(self.filepath)
+
+    def unload(self) -> None:
+        """ saves unsaved changes and drops the notes from memory until the next access"""
+        if not self.autosave:
+            return
+
+        with self._lock.write():
+            self.flush()
+            self.notes = {}
+            self.auto_counter = 0
+            self._text_index.clear()
+            self._loaded = False
 
     def load_notes(self) -> None:
-        """ load notes data from binary pickle file"""
+        """ load notes data from the patient's note file"""
+        notes = sorted(self.read_notes(), key=lambda note: note.code)
+        self.notes = {note.code: note for note in notes}
+        self.auto_counter = notes[-1].code if notes else 0
+        self._text_index.clear()
+        for note in notes:
+            self._text_index.add(note.code, note.text)
+        self._loaded = True
+        self._signature = self.file_signature()
+
+    def read_notes(self) -> [Note]:
+        """ returns the notes stored in the pickle file"""
         try:
             with open(self.filepath, 'rb') as file:
-                self.notes = pickle.load(file)
-                if self.notes:
-                    self.auto_counter = max(note.code for note in self.notes)
+                return pickle.load(file)
         except (FileNotFoundError, EOFError):
-            self.notes = []
+            return []
 
     def save_notes(self) -> None:
-        """ Save patient notes data in pickle binary file """
-        with open(self.filepath, 'wb') as file:
-            pickle.dump(self.notes, file)
-        print(f"Notes saved for patient {self.phn} in {self.filepath}")  # Debugging output
+        """ Save patient notes data in the patient's note file """
+        with self._lock.read(), self._file_lock:
+            if not self._loaded:
+                return
+
+            self._dirty = False
+            self.write_notes(list(self.notes.values()))
+            if self.autosave:
+                # without autosave there is no lock file to bump, nothing compares signatures either
+                self._file_lock.bump()
+                self._signature = self.file_signature()
+
+    def write_notes(self, notes: [Note]) -> None:
+        """ writes the notes to the pickle file, replacing it atomically"""
+        temp_filepath = self.filepath + '.tmp'
+        with open(temp_filepath, 'wb') as file:
+            pickle.dump(notes, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_filepath, self.filepath)
+
+    def commit(self, op: str, note: Note) -> None:
+        """ persists the notes after op changed note, now or through the write-behind flusher"""
+        if not self.autosave:
+            return
+
+        if self.flusher:
+            self._dirty = True
+            self.flusher.mark_dirty(self.filepath, self.flush)
+        else:
+            self.save_notes()
+
+    def flush(self) -> None:
+        """ saves the notes if they have changes the flusher has not written yet"""
+        if self._dirty:
+            self.save_notes()
 
     def search_note(self, key: int) -> Note:
         """ returns note by given id"""
-        for note in self.notes:
-            if note.code == key:
-                return note
-        return None
+        with self.reading():
+            return self.notes.get(key)
 
     def create_note(self, text: str) -> Note:
         """ Creates a new note for the patient """
-        self.auto_counter += 1
-        patient_note = Note(self.auto_counter, text)
-        self.notes.append(patient_note)
+        with self.writing():
+            self.auto_counter += 1
+            patient_note = Note(self.auto_counter, text)
+            self.notes[patient_note.code] = patient_note
+            self._text_index.add(patient_note.code, text)
 
-        if self.autosave:
-            self.save_notes()
-        print(f"Note created: {patient_note.code} - {patient_note.text}")  # Debugging output
+            self.commit("create", patient_note)
         return patient_note
 
-    def retrieve_notes(self, search_string: str) -> [Note]:
-        """ returns a list of notes with given search string"""
-        result = []
-        for note in self.notes:
-            if search_string.lower() in note.text.lower():
-                result.append(note)
-        return result
+    def retrieve_notes(self, search_string: str, limit: int = None) -> [Note]:
+        """ returns notes containing every word of the search string as a word prefix, best match first.
+        A search string without words, such as an empty one, matches the notes containing it, oldest first."""
+        with self.reading():
+            if not NoteTextIndex.tokenize(search_string):
+                return [note for note in self.notes.values() if search_string.lower() in note.text.lower()][:limit]
+
+            codes = self._text_index.search(search_string, limit)
+            return [self.notes[code] for code in codes]
 
     def update_note(self, key: int, text: str) -> bool:
         """ updates patient note by id"""
-        patient_note = self.search_note(key)
+        with self.writing():
+            patient_note = self.notes.get(key)
 
-        if patient_note:
-            patient_note.update_note(text)
-            if self.autosave:
-                self.save_notes()
-            return True
+            if patient_note:
+                patient_note.update_note(text)
+                self._text_index.add(key, text)
+                self.commit("update", patient_note)
+                return True
 
         return False
 
     def delete_note(self, key: int) -> bool:
         """ delete patient note by id"""
-        patient_note = self.search_note(key)
+        with self.writing():
+            patient_note = self.notes.get(key)
 
-        if patient_note:
-            self.notes.remove(patient_note)
-            if self.autosave:
-                self.save_notes()
-            return True
+            if patient_note:
+                del self.notes[key]
+                self._text_index.remove(key)
+                self.commit("delete", patient_note)
+                return True
 
         return False
 
+    def iter_notes(self):
+        """ yields the notes in code order, reading the file instead of loading the store when it is not in memory"""
+        if self._loaded and not self.is_stale():
+            with self._lock.read():
+                notes = list(self.notes.values())
+        else:
+            with self._file_lock:
+                notes = sorted(self.read_notes(), key=lambda note: note.code)
+        yield from notes
+
     def list_notes(self) -> [Note]:
         """ returns a list of all the patient notes """
-        temp = []
-        for note in self.notes:
-            temp.append(note.code)
-        temp.sort()
-        result = []
-        for i in range(len(temp) - 1, -1, -1):
-            result.append(self.search_note(temp[i]))
-
-        return result
+        with self.reading():
+            return list(reversed(self.notes.values()))
 
 
 
@@ -0,0 +1,81 @@
+import datetime
+from clinic.dao.note_dao import NoteDAO
+from clinic.dao.note_text_index import NoteTextIndex
+from clinic.dao.sqlite_database import SQLiteDatabase
+from clinic.note import Note
+
+
+class NoteDAOSQLite(NoteDAO):
+    def __init__(self, phn: str, database: SQLiteDatabase):
+        self.phn = int(phn)
+        self.database = database
+
+    @staticmethod
+    def _note(row) -> Note:
+        """ returns the Note for a (code, text, timestamp) row"""
+        note = Note(row[0], row[1])
+        note.timestamp = datetime.datetime.fromtimestamp(row[2])
+        return note
+
+    def is_loaded(self) -> bool:
+        """ returns false, notes are read from the database on every access"""
+        return False
+
+    def search_note(self, key: int) -> Note:
+        """ returns note by given id"""
+        row = self.database.connection().execute(
+            "SELECT code, text, timestamp FROM notes WHERE phn = ? AND code = ?", (self.phn, key)).fetchone()
+        return self._note(row) if row else None
+
+    def create_note(self, text: str) -> Note:
+        """ Creates a new note for the patient """
+        timestamp = datetime.datetime.now()
+        # one statement, so concurrent writers cannot pick the same code
+        code = self.database.connection().execute(
+            "INSERT INTO notes (phn, code, text, timestamp) "
+            "SELECT ?, COALESCE(MAX(code), 0) + 1, ?, ? FROM notes WHERE phn = ? RETURNING code",
+            (self.phn, text, timestamp.timestamp(), self.phn)).fetchone()[0]
+        note = Note(code, text)
+        note.timestamp = timestamp
+        return note
+
+    def retrieve_notes(self, search_string: str, limit: int = None) -> [Note]:
+        """ returns notes containing every word of the search string as a word prefix, best match first.
+        A search string without words, such as an empty one, matches the notes containing it, oldest first."""
+        terms = NoteTextIndex.tokenize(search_string)
+        if not terms:
+            notes = reversed(self.list_notes())
+            return [note for note in notes if search_string.lower() in note.text.lower()][:limit]
+
+        query = " AND ".join(self.database.phrase(term) + "*" for term in terms)
+        rows = self.database.connection().execute(
+            "SELECT n.code, n.text, n.timestamp FROM notes_fts JOIN notes n ON n.id = notes_fts.rowid "
+            "WHERE notes_fts MATCH ? AND n.phn = ? ORDER BY notes_fts.rank, n.code DESC LIMIT ?",
+            (query, self.phn, -1 if limit is None else limit))
+        return [self._note(row) for row in rows]
+
+    def update_note(self, key: int, text: str) -> bool:
+        """ updates patient note by id"""
+        cursor = self.database.connection().execute(
+            "UPDATE notes SET text = ?, timestamp = ? WHERE phn = ? AND code = ?",
+            (text, datetime.datetime.now().timestamp(), self.phn, key))
+        return cursor.rowcount > 0
+
+    def delete_note(self, key: int) -> bool:
+        """ delete patient note by id"""
+        cursor = self.database.connection().execute(
+            "DELETE FROM notes WHERE phn = ? AND code = ?", (self.phn, key))
+        return cursor.rowcount > 0
+
+    def list_notes(self) -> [Note]:
+        """ returns a list of all the patient notes, newest first """
+        rows = self.database.connection().execute(
+            "SELECT code, text, timestamp FROM notes WHERE phn = ? ORDER BY code DESC", (self.phn,))
+        return [self._note(row) for row in rows]
+
+    def iter_notes(self):
+        """ yields the patient notes in code order as the rows are read"""
+        rows = self.database.connection().execute(
+            "SELECT code, text, timestamp FROM notes WHERE phn = ? ORDER BY code", (self.phn,))
+        for row in rows:
+            yield self._note(row)
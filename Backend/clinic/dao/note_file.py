@@ -0,0 +1,142 @@
+import datetime
+import mmap
+import os
+import struct
+from clinic.note import Note
+from clinic.exception.invalid_note_file_exception import InvalidNoteFileException
+
+# Layout, all little endian:
+#   header  magic, version, reserved, note count, offset of the index
+#   records one per note: timestamp (epoch seconds), text length, UTF-8 text
+#   index   one (code, record offset) pair per note, sorted by code
+# The journal next to it is a sequence of (op, code, timestamp, text length, UTF-8 text)
+# records, where op is PUT for a created or updated note and TOMBSTONE for a deleted one.
+MAGIC = b"SPNR"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIQ")
+RECORD = struct.Struct("<dI")
+INDEX_ENTRY = struct.Struct("<QQ")
+JOURNAL_RECORD = struct.Struct("<cQdI")
+PUT = b"P"
+TOMBSTONE = b"T"
+
+
+def write_notes(filepath: str, notes) -> None:
+    """ writes the notes to filepath in the binary note format, replacing the file atomically"""
+    notes = sorted(notes, key=lambda note: note.code)
+    temp_filepath = filepath + ".tmp"
+    with open(temp_filepath, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, 0, len(notes), 0))
+        offsets = []
+        for note in notes:
+            text = note.text.encode("utf-8")
+            offsets.append(file.tell())
+            file.write(RECORD.pack(note.timestamp.timestamp(), len(text)))
+            file.write(text)
+
+        index_offset = file.tell()
+        for note, offset in zip(notes, offsets):
+            file.write(INDEX_ENTRY.pack(note.code, offset))
+
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, VERSION, 0, len(notes), index_offset))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_filepath, filepath)
+
+
+def append_journal(filepath: str, op: bytes, note: Note) -> None:
+    """ appends one PUT or TOMBSTONE record for the note to the journal and waits until it is on disk"""
+    text = note.text.encode("utf-8") if op == PUT else b""
+    with open(filepath, "ab") as file:
+        file.write(JOURNAL_RECORD.pack(op, note.code, note.timestamp.timestamp(), len(text)) + text)
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def read_journal(filepath: str) -> list:
+    """ returns the (op, note) records of the journal, truncating a record torn by a crash mid-append"""
+    try:
+        with open(filepath, "rb") as file:
+            data = file.read()
+    except FileNotFoundError:
+        return []
+
+    records = []
+    offset = 0
+    while offset + JOURNAL_RECORD.size <= len(data):
+        op, code, timestamp, length = JOURNAL_RECORD.unpack_from(data, offset)
+        start = offset + JOURNAL_RECORD.size
+        if op not in (PUT, TOMBSTONE) or start + length > len(data):
+            break
+        note = Note(code, data[start:start + length].decode("utf-8"))
+        note.timestamp = datetime.datetime.fromtimestamp(timestamp)
+        records.append((op, note))
+        offset = start + length
+
+    if offset < len(data):
+        with open(filepath, "r+b") as file:
+            file.truncate(offset)
+    return records
+
+
+class NoteFileReader:
+    def __init__(self, filepath: str) -> None:
+        with open(filepath, "rb") as file:
+            try:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise InvalidNoteFileException(f"{filepath} is empty")
+
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise InvalidNoteFileException(f"{filepath} is too short for a note file")
+
+        magic, version, _, self._count, self._index_offset = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise InvalidNoteFileException(f"{filepath} is not a version {VERSION} note file")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self):
+        """ yields every note in ascending code order"""
+        for position in range(self._count):
+            yield self._read_entry(position)
+
+    def close(self) -> None:
+        """ releases the memory map"""
+        self._map.close()
+
+    def read_note(self, code: int) -> Note:
+        """ returns the note with the given code without decoding any other note, or None"""
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            entry_code, _ = INDEX_ENTRY.unpack_from(self._map, self._index_offset + middle * INDEX_ENTRY.size)
+            if entry_code < code:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self._count:
+            note = self._read_entry(low)
+            if note.code == code:
+                return note
+        return None
+
+    def _read_entry(self, position: int) -> Note:
+        """ decodes the note referenced by the index entry at position"""
+        code, offset = INDEX_ENTRY.unpack_from(self._map, self._index_offset + position * INDEX_ENTRY.size)
+        timestamp, length = RECORD.unpack_from(self._map, offset)
+        start = offset + RECORD.size
+        note = Note(code, self._map[start:start + length].decode("utf-8"))
+        note.timestamp = datetime.datetime.fromtimestamp(timestamp)
+        return note
@@ -0,0 +1,52 @@
+import threading
+from collections import OrderedDict
+
+
+class NoteStoreCache:
+    def __init__(self, capacity = 256, max_notes = None) -> None:
+        self.capacity = capacity
+        self.max_notes = max_notes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._stores = OrderedDict()
+        self._lock = threading.Lock()
+
+    def touch(self, store) -> None:
+        """ records an access to a loaded note store and evicts the least recently used stores over the limits"""
+        with self._lock:
+            if store in self._stores:
+                self.hits += 1
+                self._stores.move_to_end(store)
+            else:
+                self.misses += 1
+                self._stores[store] = None
+
+            evicted = []
+            resident_notes = self._resident_notes() if self.max_notes is not None else 0
+            while len(self._stores) > 1 and (len(self._stores) > self.capacity
+                                             or (self.max_notes is not None and resident_notes > self.max_notes)):
+                victim, _ = self._stores.popitem(last=False)
+                resident_notes -= len(victim.notes)
+                self.evictions += 1
+                evicted.append(victim)
+
+        for victim in evicted:
+            victim.unload()
+
+    def stats(self) -> dict:
+        """ returns the cache counters and current residency"""
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "max_notes": self.max_notes,
+                "resident_stores": len(self._stores),
+                "resident_notes": self._resident_notes(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _resident_notes(self) -> int:
+        """ returns the number of notes held by the resident stores"""
+        return sum(len(store.notes) for store in self._stores)
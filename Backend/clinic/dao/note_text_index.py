@@ -0,0 +1,115 @@
+import heapq
+import math
+import re
+from bisect import bisect_left, insort
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class NoteTextIndex:
+    def __init__(self, k1 = 1.2, b = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self._postings = {}
+        self._vocabulary = []
+        self._documents = {}
+        self._lengths = {}
+        self._total_length = 0
+
+    @staticmethod
+    def tokenize(text: str) -> list:
+        """ returns the case-folded word tokens of the text"""
+        return TOKEN_PATTERN.findall(text.casefold())
+
+    def add(self, key, text: str) -> None:
+        """ indexes text under key, replacing whatever was indexed under key before"""
+        self.remove(key)
+        counts = Counter(self.tokenize(text))
+        self._documents[key] = counts
+        self._lengths[key] = sum(counts.values())
+        self._total_length += self._lengths[key]
+        for token, frequency in counts.items():
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = {}
+                insort(self._vocabulary, token)
+            posting[key] = frequency
+
+    def remove(self, key) -> None:
+        """ removes key from the index if present"""
+        counts = self._documents.pop(key, None)
+        if counts is None:
+            return
+
+        self._total_length -= self._lengths.pop(key)
+        for token in counts:
+            posting = self._postings[token]
+            del posting[key]
+            if not posting:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+
+    def clear(self) -> None:
+        """ empties the index"""
+        self._postings.clear()
+        self._vocabulary.clear()
+        self._documents.clear()
+        self._lengths.clear()
+        self._total_length = 0
+
+    def search(self, query: str, limit: int = None) -> list:
+        """ returns the keys matching every query term as a word prefix, best BM25 score first, none for a query without words"""
+        terms = set(self.tokenize(query))
+        if not self._documents or not terms:
+            return []
+
+        scores = None
+        for tokens in sorted((self._expand(term) for term in terms), key=self._posting_size):
+            term_scores = self._score_tokens(tokens, scores)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {key: score + term_scores[key] for key, score in scores.items() if key in term_scores}
+            if not scores:
+                return []
+
+        ranked = ((score, key) for key, score in scores.items())
+        if limit is None:
+            ranked = sorted(ranked, reverse=True)
+        else:
+            ranked = heapq.nlargest(limit, ranked)
+        return [key for score, key in ranked]
+
+    def _expand(self, term: str) -> list:
+        """ returns the indexed tokens that start with term"""
+        tokens = []
+        position = bisect_left(self._vocabulary, term)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(term):
+            tokens.append(self._vocabulary[position])
+            position += 1
+        return tokens
+
+    def _posting_size(self, tokens: list) -> int:
+        """ returns the number of postings a term expanded to tokens has to visit"""
+        return sum(len(self._postings[token]) for token in tokens)
+
+    def _score_tokens(self, tokens: list, candidates: dict = None) -> dict:
+        """ returns the BM25 score of every key containing one of the tokens, restricted to candidates if given"""
+        document_count = len(self._documents)
+        average_length = (self._total_length / document_count) or 1
+        scores = {}
+
+        for token in tokens:
+            posting = self._postings[token]
+            idf = math.log(1 + (document_count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for key, frequency in posting.items():
+                if candidates is not None and key not in candidates:
+                    continue
+                length = self._lengths[key]
+                norm = frequency + self.k1 * (1 - self.b + self.b * length / average_length)
+                score = idf * frequency * (self.k1 + 1) / norm
+                # a prefix that expands to several words scores as its best expansion
+                if score > scores.get(key, 0):
+                    scores[key] = score
+        return scores
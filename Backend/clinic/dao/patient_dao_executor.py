@@ -0,0 +1,61 @@
+import asyncio
+from concurrent.futures import Executor
+from functools import partial
+from clinic.dao.async_patient_dao import AsyncPatientDAO
+from clinic.dao.patient_dao import PatientDAO
+from clinic.patient import Patient
+
+
+class PatientDAOExecutor(AsyncPatientDAO):
+    """ runs a blocking PatientDAO on a thread pool so the event loop never waits on file or database I/O.
+    The pool's worker count bounds how many DAO calls run at once, further calls queue."""
+
+    def __init__(self, patient_dao: PatientDAO, executor: Executor) -> None:
+        self.patient_dao = patient_dao
+        self.executor = executor
+
+    async def run(self, function, *args):
+        """ returns the result of function(*args), called on the executor"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(function, *args))
+
+    async def search_patient(self, key: int) -> Patient:
+        return await self.run(self.patient_dao.search_patient, key)
+
+    async def create_patient(self, patient: Patient) -> Patient:
+        return await self.run(self.patient_dao.create_patient, patient)
+
+    async def retrieve_patients(self, name: str) -> [Patient]:
+        return await self.run(self.patient_dao.retrieve_patients, name)
+
+    async def update_patient(self, key: int, patient: Patient) -> bool:
+        return await self.run(self.patient_dao.update_patient, key, patient)
+
+    async def delete_patient(self, phn: int) -> bool:
+        return await self.run(self.patient_dao.delete_patient, phn)
+
+    async def list_patients(self) -> [Patient]:
+        return await self.run(self.patient_dao.list_patients)
+
+    async def list_patients_page(self, after_phn: int = None, limit: int = 100) -> [Patient]:
+        return await self.run(self.patient_dao.list_patients_page, after_phn, limit)
+
+    async def retrieve_patients_page(self, name: str, after: tuple = None, limit: int = 100) -> [Patient]:
+        return await self.run(self.patient_dao.retrieve_patients_page, name, after, limit)
+
+    async def retrieve_patients_fuzzy(self, name: str, threshold: float = 0.4, limit: int = 100) -> [Patient]:
+        return await self.run(self.patient_dao.retrieve_patients_fuzzy, name, threshold, limit)
+
+    async def retrieve_patients_by_phone(self, phone: str) -> [Patient]:
+        return await self.run(self.patient_dao.retrieve_patients_by_phone, phone)
+
+    async def retrieve_patients_by_email(self, email: str) -> [Patient]:
+        return await self.run(self.patient_dao.retrieve_patients_by_email, email)
+
+    async def retrieve_patients_born_between(self, after: str = None, before: str = None) -> [Patient]:
+        return await self.run(self.patient_dao.retrieve_patients_born_between, after, before)
+
+    async def autocomplete(self, prefix: str, limit: int = 10) -> [Patient]:
+        return await self.run(self.patient_dao.autocomplete, prefix, limit)
+
+    async def version(self) -> tuple[str, float]:
+        return await self.run(self.patient_dao.version)
@@ -1,20 +1,65 @@
+import hashlib
 import json
+import os
+import time
+import uuid
 from json import JSONDecodeError
 from clinic.dao.patient_decoder import PatientDecoder
 from clinic.dao.patient_encoder import PatientEncoder
 from clinic.patient import Patient
 from clinic.dao.patient_dao import PatientDAO
+from clinic.dao.trigram_index import TrigramIndex
+from clinic.dao.sorted_index import SortedIndex
+from clinic.dao.search_cache import SearchCache
+from clinic.dao.patient_keys import phone_key, email_key
+from clinic.dao.file_lock import FileLock
+from clinic.dao.rw_lock import ReadWriteLock
+from bisect import bisect_right
+from math import inf
+from contextlib import nullcontext
 
 
 
 class PatientDAOJSON(PatientDAO):
-    def __init__(self, autosave = False):
+    def __init__(self, autosave = False, journal = False, journal_limit = 4 * 1024 * 1024, flusher = None, note_stores = None,
+                 search_cache_capacity = 256, search_cache_max_keys = 1000000):
         self._autosave = autosave
+        self._flusher = flusher
+        self._note_stores = note_stores
+        self._journal = journal
+        self._journal_limit = journal_limit
         self.patients = {}
         self.filepath = "./clinic/patients.json"
+        self.journal_filepath = "./clinic/patients.log"
+        self._name_index = TrigramIndex()
+        self._phn_order = SortedIndex()
+        self._name_order = SortedIndex()
+        # normalized phone and email to the PHNs having them, and (birth date, phn) keys for date ranges
+        self._phone_index = {}
+        self._email_index = {}
+        self._birth_order = SortedIndex()
+        # typed searches repeat and extend each other, mutations drop only the queries the changed names match
+        self.search_cache = SearchCache(search_cache_capacity, search_cache_max_keys)
+        # writers hold the lock across processes, readers compare the signature to notice their writes
+        self._file_lock = FileLock(self.filepath + ".lock") if autosave else nullcontext()
+        self._signature = None
+        # searches and listings share the patients and indexes, mutations and reloads take them exclusively
+        self._lock = ReadWriteLock()
+        # bumped on every change this process makes or loads, the epoch keeps versions of other processes apart
+        self._epoch = uuid.uuid4().hex[:12]
+        self._version = 0
+        # changes since the patients in memory were last the ones in the files, see version()
+        self._unsaved = 0
+        self._modified = time.time()
 
         if self._autosave:
-            self.patients = self.load_patients()
+            with self._file_lock:
+                self.patients = self.load_patients()
+                if self._journal and self.journal_size() > self._journal_limit:
+                    self.compact_journal()
+                self._synced()
+
+        self.rebuild_indexes()
 
 
     def load_patients(self) -> dict[int, Patient]:
@@ -22,83 +67,471 @@ class PatientDAOJSON(PatientDAO):
         patients = {}
         try:
             with open(self.filepath, "r") as file:
-                data = json.load(file, cls=PatientDecoder)
+                data = json.load(file, cls=PatientDecoder, flusher=self._flusher, note_stores=self._note_stores)
                 for phn, patient in data.items():
                     patients[int(phn)] = patient
 
         except FileNotFoundError or EOFError or JSONDecodeError:
             patients = {}
 
+        if self._journal:
+            self.replay_journal(patients)
+
         return patients
 
     def save_patients(self):
         """ saves the Patients to patient json file"""
-        with open(self.filepath, "w") as file:
-            json.dump(self.patients, file, cls=PatientEncoder)
+        with self._lock.read(), self._file_lock:
+            patients = dict(self.patients)
+            temp_filepath = self.filepath + ".tmp"
+            with open(temp_filepath, "w") as file:
+                json.dump(patients, file, cls=PatientEncoder)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_filepath, self.filepath)
+            if self._autosave:
+                # without autosave there is no lock file to bump, nothing compares signatures either
+                self._file_lock.bump()
+                self._synced()
+
+    def replay_journal(self, patients: dict[int, Patient]) -> None:
+        """ applies the journal entries on top of the patients loaded from the snapshot"""
+        for entry in self.read_journal():
+            if entry["op"] == "put":
+                patients[entry["phn"]] = entry["patient"]
+            elif entry["op"] == "put_many":
+                for patient in entry["patients"]:
+                    patients[patient.phn] = patient
+            elif entry["op"] == "delete":
+                patients.pop(entry["phn"], None)
+
+    def read_journal(self, offset: int = 0) -> list[dict]:
+        """ returns the journal entries from offset on, truncating a record torn by a crash mid-append"""
+        entries = []
+        valid_size = offset
+        try:
+            with open(self.journal_filepath, "rb") as file:
+                file.seek(offset)
+                for line in file:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        entries.append(json.loads(line, cls=PatientDecoder, flusher=self._flusher, note_stores=self._note_stores))
+                    except JSONDecodeError:
+                        break
+                    valid_size += len(line)
+        except FileNotFoundError:
+            return entries
+
+        # drop a record torn by a crash mid-append so new records are not appended after it
+        if valid_size < self.journal_size():
+            with open(self.journal_filepath, "r+b") as file:
+                file.truncate(valid_size)
+        return entries
+
+    def append_journal(self, op: str, phn: int, patient: Patient = None) -> None:
+        """ appends one mutation record to the journal and waits until it is on disk"""
+        entry = {"op": op, "phn": phn}
+        if patient is not None:
+            entry["patient"] = patient
+
+        self.append_journal_line(json.dumps(entry, cls=PatientEncoder))
+
+    def append_journal_line(self, line: str) -> None:
+        """ appends an encoded record to the journal and waits until it is on disk"""
+        with open(self.journal_filepath, "a") as file:
+            file.write(line + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+            size = file.tell()
+
+        if size > self._journal_limit:
+            self.compact_journal()
+
+    def compact_journal(self) -> None:
+        """ folds the journal into a new snapshot and empties the journal"""
+        with self._lock.write(), self._file_lock:
+            self.save_patients()
+            with open(self.journal_filepath, "w") as file:
+                file.flush()
+                os.fsync(file.fileno())
+            self._file_lock.bump()
+            self._synced()
+
+    def journal_size(self) -> int:
+        """ returns the size of the journal in bytes"""
+        try:
+            return os.path.getsize(self.journal_filepath)
+        except FileNotFoundError:
+            return 0
+
+    def commit(self, op: str, phn: int, patient: Patient = None) -> None:
+        """ persists a single mutation as a journal record, a deferred snapshot or a full snapshot"""
+        if not self._autosave:
+            return
+
+        if self._journal:
+            self.append_journal(op, phn, patient)
+            self._file_lock.bump()
+            self._synced()
+        elif self._flusher:
+            # a deferred snapshot is only safe with a single writer process, use the journal for several
+            self._flusher.mark_dirty(self.filepath, self.save_patients)
+        else:
+            self.save_patients()
+
+    def commit_batch(self, patients: [Patient]) -> None:
+        """ persists patients created together with one durable write, so a crash keeps all or none of them"""
+        if not self._autosave or not patients:
+            return
+
+        if self._journal:
+            line = json.dumps({"op": "put_many", "patients": patients}, cls=PatientEncoder)
+            if self.journal_size() + len(line) > self._journal_limit:
+                # the batch would fill the journal anyway, a snapshot that already holds it is the one write needed
+                self.compact_journal()
+            else:
+                self.append_journal_line(line)
+            self._file_lock.bump()
+            self._synced()
+        elif self._flusher:
+            self._flusher.mark_dirty(self.filepath, self.save_patients)
+        else:
+            self.save_patients()
+
+    def file_signature(self) -> tuple:
+        """ returns the write counter and the signature of the snapshot and journal files"""
+        return self._file_lock.signature(self.filepath, self.journal_filepath)
+
+    def refresh(self) -> None:
+        """ reloads the patients if another process wrote the files since this one last read or wrote them"""
+        if not self._autosave or self.file_signature() == self._signature:
+            return
+
+        with self._lock.write(), self._file_lock:
+            self._reload()
+
+    def _reload(self) -> None:
+        """ catches up with writes by other processes, by replaying only the new journal records when it can"""
+        signature = self.file_signature()
+        if signature == self._signature:
+            return
+
+        _, snapshot, journal = signature
+        _, old_snapshot, old_journal = self._signature or (None, None, None)
+        appended_only = (self._journal and self._signature is not None and snapshot == old_snapshot
+                         and journal is not None and (old_journal is None
+                                                      or (journal[0] == old_journal[0] and journal[1] >= old_journal[1])))
+        if appended_only:
+            for entry in self.read_journal(old_journal[1] if old_journal else 0):
+                if entry["op"] == "put":
+                    self._put_loaded(entry["phn"], entry["patient"])
+                elif entry["op"] == "put_many":
+                    for patient in entry["patients"]:
+                        self._put_loaded(patient.phn, patient)
+                elif entry["op"] == "delete" and entry["phn"] in self.patients:
+                    self._unindex_patient(entry["phn"], self.patients.pop(entry["phn"]))
+                    self._name_index.remove(entry["phn"])
+        else:
+            patients = self.load_patients()
+            # keep the Patient objects that are still there so their note stores survive the reload
+            for phn, patient in patients.items():
+                existing = self.patients.get(phn)
+                if existing is not None:
+                    existing.update_data(patient.name, patient.birth_date, patient.phone, patient.email, patient.address)
+                    patients[phn] = existing
+            self.patients = patients
+            self.rebuild_indexes()
+
+        self._changed()
+        self._synced()
+
+    def _put_loaded(self, phn: int, patient: Patient) -> None:
+        """ applies a patient read from another process's journal record"""
+        existing = self.patients.get(phn)
+        if existing is None:
+            self.patients[phn] = patient
+        else:
+            self._unindex_patient(phn, existing)
+            existing.update_data(patient.name, patient.birth_date, patient.phone, patient.email, patient.address)
+        self._index_patient(phn, self.patients[phn])
+
+    def _changed(self) -> None:
+        """ records that the patients changed, for version()"""
+        self._version += 1
+        self._unsaved += 1
+        self._modified = time.time()
+
+    def _synced(self) -> None:
+        """ records that the patients in memory are the ones in the files, callers hold the file lock"""
+        self._signature = self.file_signature()
+        self._unsaved = 0
+
+    def version(self) -> tuple[str, float]:
+        """ returns a token that changes whenever the patients change, and the time they last changed.
+        While the patients are the ones in the files the token is derived from the file signature,
+        so every process holding them gives the same token."""
+        self.refresh()
+        with self._lock.read():
+            if self._signature is None or self._unsaved:
+                # changes only this process holds, not saved yet or never saved
+                return f"{self._epoch}-{self._version}", self._modified
+            digest = hashlib.blake2b(repr(self._signature).encode(), digest_size=8).hexdigest()
+            return f"{self._signature[0]}-{digest}", self._modified
+
+    def rebuild_indexes(self) -> None:
+        """ rebuilds the search indexes from the loaded patients"""
+        self._name_index.clear()
+        self.search_cache.clear()
+        self._phn_order.clear()
+        self._name_order.clear()
+        self._phone_index.clear()
+        self._email_index.clear()
+        self._birth_order.clear()
+        for phn, patient in self.patients.items():
+            self._index_patient(phn, patient)
+
+    @staticmethod
+    def _index_keys(phn: int, patient: Patient) -> tuple:
+        """ returns the name, phone, email and birth date keys the patient is indexed under as phn, no birth date key
+        for a patient without a birth date.
+        Writers compute them before changing anything, so a patient that cannot be indexed changes nothing."""
+        return (patient.name.casefold(), phn), phone_key(patient.phone), email_key(patient.email), \
+            ((patient.birth_date, phn) if patient.birth_date else None)
+
+    def _index_patient(self, phn: int, patient: Patient, keys: tuple = None) -> None:
+        """ adds the patient to the search and ordering indexes, under keys if already computed"""
+        name_key, phone, email, birth_key = keys or self._index_keys(phn, patient)
+        # the name index and the name order share the one folded copy of the name
+        self._name_index.add(phn, name_key[0])
+        self.search_cache.invalidate(patient.name)
+        self._phn_order.add(phn)
+        self._name_order.add(name_key)
+        self._add_key(self._phone_index, phone, phn)
+        self._add_key(self._email_index, email, phn)
+        if birth_key is not None:
+            # undated patients are in no birth date range
+            self._birth_order.add(birth_key)
+
+    def _unindex_patient(self, phn: int, patient: Patient) -> None:
+        """ removes the patient from the ordering indexes and drops its cached rendering and searches, the name index is updated by the caller"""
+        self.search_cache.invalidate(patient.name)
+        self._phn_order.remove(phn)
+        self._name_order.remove(self.name_key(patient))
+        self._remove_key(self._phone_index, phone_key(patient.phone), phn)
+        self._remove_key(self._email_index, email_key(patient.email), phn)
+        if patient.birth_date:
+            self._birth_order.remove((patient.birth_date, phn))
+        patient.clear_json()
+
+    @staticmethod
+    def _add_key(index: dict, key: str, phn: int) -> None:
+        """ adds phn to the PHNs indexed under key, held as a bare PHN until a second patient shares the key"""
+        if not key:
+            return
+        phns = index.get(key)
+        if phns is None or phns == phn:
+            index[key] = phn
+        elif isinstance(phns, set):
+            phns.add(phn)
+        else:
+            index[key] = {phns, phn}
+
+    @staticmethod
+    def _remove_key(index: dict, key: str, phn: int) -> None:
+        """ removes phn from the PHNs indexed under key"""
+        phns = index.get(key)
+        if phns == phn:
+            del index[key]
+        elif isinstance(phns, set):
+            phns.discard(phn)
+            if len(phns) == 1:
+                index[key] = phns.pop()
+
+    @staticmethod
+    def _lookup_key(index: dict, key: str) -> list:
+        """ returns the PHNs indexed under key in ascending order"""
+        phns = index.get(key)
+        if phns is None:
+            return []
+        return sorted(phns) if isinstance(phns, set) else [phns]
+
+    @staticmethod
+    def name_key(patient: Patient) -> tuple:
+        """ returns the (case-folded name, phn) key patients are ordered by in name searches"""
+        return (patient.name.casefold(), patient.phn)
 
     def create_patient(self, patient: Patient) -> Patient:
         """ creates a new patient and adds it to the database."""
         phn = patient.phn
-        self.patients[phn] = patient
-        if self._autosave:
-            self.save_patients()
+        with self._lock.write(), self._file_lock:
+            self.refresh()
+            keys = self._index_keys(phn, patient)
+            if phn in self.patients:
+                self._unindex_patient(phn, self.patients[phn])
+            self.patients[phn] = patient
+            self._index_patient(phn, patient, keys)
+            self._changed()
+            self.commit("put", phn, patient)
 
         return patient
 
+    def create_patients(self, patients: [Patient]) -> [Patient]:
+        """ creates the given patients and adds them to the database with a single write."""
+        with self._lock.write(), self._file_lock:
+            self.refresh()
+            if len(patients) > self.search_cache.capacity:
+                # cheaper than checking every cached query against every name
+                self.search_cache.clear()
+            all_keys = [self._index_keys(patient.phn, patient) for patient in patients]
+            for patient, keys in zip(patients, all_keys):
+                phn = patient.phn
+                if phn in self.patients:
+                    self._unindex_patient(phn, self.patients[phn])
+                self.patients[phn] = patient
+                self._index_patient(phn, patient, keys)
+            self._changed()
+            self.commit_batch(patients)
+
+        return patients
+
     def search_patient(self, key: int) -> Patient:
         """ returns the patient by PHN if found, else None."""
-        if key in self.patients:
-            return self.patients[key]
-        else:
-            return None
+        self.refresh()
+        with self._lock.read():
+            if key in self.patients:
+                return self.patients[key]
+            else:
+                return None
 
     def retrieve_patients(self, name: str) -> [Patient]:
-        """ returns a list of patients matching the given name."""
-        result = []
-        for phn in self.patients:
-
-            patient = self.patients[phn]
-            patient_name = patient.get_name().lower()
-            name = name.lower()
+        """ returns a list of patients matching the given name, most recently added first."""
+        self.refresh()
+        with self._lock.read():
+            return [self.patients[phn] for phn in self._search(name)]
 
-            if name in patient_name:
-                result.append(patient)
+    def retrieve_patients_fuzzy(self, name: str, threshold: float = 0.4, limit: int = 100) -> [Patient]:
+        """ returns up to limit patients whose name shares at least threshold of the trigrams of name, most similar first."""
+        self.refresh()
+        with self._lock.read():
+            return [self.patients[phn] for phn, _ in self._name_index.similar(name, threshold, limit)]
 
-        result.reverse()
+    def _search(self, name: str) -> list:
+        """ returns the PHNs of the patients whose name contains name, most recently added first, from the search cache when it can"""
+        folded = name.casefold()
+        phns = self.search_cache.get(folded)
+        if phns is not None:
+            return phns
 
-        return result
+        # every match of a query also matches its prefixes, so a cached prefix result only needs filtering
+        candidates = self.search_cache.get_prefix(folded)
+        if candidates is not None:
+            phns = [phn for phn in candidates if self._name_index.contains(phn, folded)]
+        else:
+            phns = self._name_index.search(folded)
+        self.search_cache.put(folded, phns)
+        return phns
 
     def update_patient(self, key: int, updated_patient: Patient) -> bool:
         """ updates a patient's information if they exist, using the provided Patient object."""
-        if key not in self.patients:
-            return False
-
-        existing_patient = self.patients[key]
-        existing_patient.update_data(
-            updated_patient.name,
-            updated_patient.birth_date,
-            updated_patient.phone,
-            updated_patient.email,
-            updated_patient.address
-        )
+        with self._lock.write(), self._file_lock:
+            self.refresh()
+            if key not in self.patients:
+                return False
 
-        if self._autosave:
-            self.save_patients()
+            keys = self._index_keys(key, updated_patient)
+            existing_patient = self.patients[key]
+            self._unindex_patient(key, existing_patient)
+            existing_patient.update_data(
+                updated_patient.name,
+                updated_patient.birth_date,
+                updated_patient.phone,
+                updated_patient.email,
+                updated_patient.address
+            )
+            self._index_patient(key, existing_patient, keys)
+            self._changed()
+
+            self.commit("put", key, existing_patient)
         return True
 
     def delete_patient(self, phn: int) -> bool:
         """ deletes a patient by PHN if found."""
-        if phn in self.patients:
+        with self._lock.write(), self._file_lock:
+            self.refresh()
+            if phn in self.patients:
 
-            del self.patients[phn]
-            if self._autosave:
-                self.save_patients()
-            return True
+                self._unindex_patient(phn, self.patients[phn])
+                del self.patients[phn]
+                self._name_index.remove(phn)
+                self._changed()
+                self.commit("delete", phn)
+                return True
 
         return False
 
     def list_patients(self) -> [Patient]:
         """ returns a list of all patients."""
-        result = list(self.patients.values())
+        self.refresh()
+        with self._lock.read():
+            result = list(self.patients.values())
 
         return result
+
+    def list_patients_page(self, after_phn: int = None, limit: int = 100) -> [Patient]:
+        """ returns up to limit patients with a PHN greater than after_phn, in PHN order."""
+        self.refresh()
+        with self._lock.read():
+            return [self.patients[phn] for phn in self._phn_order.after(after_phn, limit)]
+
+    def retrieve_patients_page(self, name: str, after: tuple = None, limit: int = 100) -> [Patient]:
+        """ returns up to limit patients matching the given name whose name key follows after, in name key order."""
+        self.refresh()
+        with self._lock.read():
+            if not name:
+                return [self.patients[phn] for _, phn in self._name_order.after(after, limit)]
+
+            phns = self._search(name)
+            if len(phns) * len(phns) <= len(self._name_order) * limit:
+                # few matches, sorting them costs less than walking past the names between them
+                keys = sorted(self.name_key(self.patients[phn]) for phn in phns)
+                start = 0 if after is None else bisect_right(keys, after)
+                return [self.patients[phn] for _, phn in keys[start:start + limit]]
+
+            # matches are dense in the name order, so a page is found after about limit * names / matches keys
+            folded = name.casefold()
+            page = []
+            for folded_name, phn in self._name_order.iterate_after(after):
+                if folded in folded_name:
+                    page.append(self.patients[phn])
+                    if len(page) == limit:
+                        break
+            return page
+
+    def autocomplete(self, prefix: str, limit: int = 10) -> [Patient]:
+        """ returns up to limit patients whose name starts with prefix, ignoring case, in name key order."""
+        folded = prefix.casefold()
+        self.refresh()
+        with self._lock.read():
+            # the names starting with the prefix are one run of the name order, beginning where the prefix would sort
+            return [self.patients[phn] for name, phn in self._name_order.starting_at((folded,), limit)
+                    if name.startswith(folded)]
+
+    def retrieve_patients_by_phone(self, phone: str) -> [Patient]:
+        """ returns the patients with the given phone number, ignoring formatting, in PHN order."""
+        self.refresh()
+        with self._lock.read():
+            return [self.patients[phn] for phn in self._lookup_key(self._phone_index, phone_key(phone))]
+
+    def retrieve_patients_by_email(self, email: str) -> [Patient]:
+        """ returns the patients with the given email address, ignoring case, in PHN order."""
+        self.refresh()
+        with self._lock.read():
+            return [self.patients[phn] for phn in self._lookup_key(self._email_index, email_key(email))]
+
+    def retrieve_patients_born_between(self, after: str = None, before: str = None) -> [Patient]:
+        """ returns the patients born on or after after and on or before before, ISO dates that are open when None, in birth date order."""
+        self.refresh()
+        with self._lock.read():
+            keys = self._birth_order.between(None if after is None else (after,), None if before is None else (before, inf))
+            return [self.patients[phn] for _, phn in keys]
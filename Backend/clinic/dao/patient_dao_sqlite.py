@@ -0,0 +1,185 @@
+from clinic.dao.patient_dao import PatientDAO
+from clinic.dao.sqlite_database import SQLiteDatabase
+from clinic.dao.trigram_index import TrigramIndex
+from clinic.dao.patient_keys import phone_key, email_key
+from clinic.patient import Patient
+
+COLUMNS = "phn, name, birth_date, phone, email, address"
+UPSERT = (f"INSERT INTO patients ({COLUMNS}, name_key, phone_key, email_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+          "ON CONFLICT (phn) DO UPDATE SET name = excluded.name, birth_date = excluded.birth_date, "
+          "phone = excluded.phone, email = excluded.email, address = excluded.address, name_key = excluded.name_key, "
+          "phone_key = excluded.phone_key, email_key = excluded.email_key")
+
+
+class PatientDAOSQLite(PatientDAO):
+    def __init__(self, database: SQLiteDatabase):
+        self.database = database
+
+    def _patient(self, row) -> Patient:
+        """ returns the Patient for a row of COLUMNS"""
+        return Patient(*row, autosave=True, database=self.database)
+
+    def create_patient(self, patient: Patient) -> Patient:
+        """ creates a new patient and adds it to the database."""
+        self.database.connection().execute(UPSERT, self._row(patient))
+        return patient
+
+    def create_patients(self, patients: [Patient]) -> [Patient]:
+        """ creates the given patients and adds them to the database in a single transaction."""
+        connection = self.database.connection()
+        with connection:
+            connection.execute("BEGIN")
+            connection.executemany(UPSERT, (self._row(patient) for patient in patients))
+        return patients
+
+    @staticmethod
+    def _row(patient: Patient) -> tuple:
+        """ returns the UPSERT parameters for a patient"""
+        return (patient.phn, patient.name, patient.birth_date, patient.phone, patient.email, patient.address,
+                patient.name.casefold(), phone_key(patient.phone), email_key(patient.email))
+
+    def search_patient(self, key: int) -> Patient:
+        """ returns the patient by PHN if found, else None."""
+        row = self.database.connection().execute(
+            f"SELECT {COLUMNS} FROM patients WHERE phn = ?", (key,)).fetchone()
+        return self._patient(row) if row else None
+
+    def retrieve_patients(self, name: str) -> [Patient]:
+        """ returns a list of patients matching the given name, most recently added first."""
+        rows = self._matching(name, "ORDER BY p.id DESC", ())
+        return [self._patient(row) for row in rows]
+
+    def _matching(self, name: str, clauses: str, parameters: tuple):
+        """ returns the rows of patients whose name contains name, filtered and ordered by clauses.
+        The trigram index folds case one character at a time, so queries of 3 or more characters do not match
+        across multi-character foldings such as "ss" for "ß" the way the JSON store's casefold() does."""
+        connection = self.database.connection()
+        if len(name) >= 3:
+            # the trigram tokenizer answers case-insensitive substring phrases from the index
+            return connection.execute(
+                "SELECT p.phn, p.name, p.birth_date, p.phone, p.email, p.address "
+                "FROM patients_fts JOIN patients p ON p.id = patients_fts.rowid "
+                "WHERE patients_fts MATCH ? " + clauses,
+                (self.database.phrase(name),) + parameters)
+
+        # LIKE only ignores ASCII case, the name key is case-folded by Python like the JSON store's names
+        return connection.execute(
+            "SELECT p.phn, p.name, p.birth_date, p.phone, p.email, p.address "
+            "FROM patients p WHERE instr(p.name_key, ?) > 0 " + clauses,
+            (name.casefold(),) + parameters)
+
+    def retrieve_patients_fuzzy(self, name: str, threshold: float = 0.4, limit: int = 100,
+                                candidates: int = 1000) -> [Patient]:
+        """ returns up to limit patients whose name shares at least threshold of the trigrams of name, most similar first."""
+        query_trigrams = TrigramIndex.padded_trigrams(name.casefold())
+        # the FTS index only holds the trigrams inside names, the padded ones at either end cannot be matched there
+        inner = [trigram for trigram in query_trigrams if trigram.strip() == trigram]
+        if not inner:
+            return []
+
+        # bm25 ranks names sharing more and rarer trigrams first, the best candidates are then scored exactly
+        rows = self.database.connection().execute(
+            "SELECT p.phn, p.name, p.birth_date, p.phone, p.email, p.address "
+            "FROM patients_fts JOIN patients p ON p.id = patients_fts.rowid "
+            "WHERE patients_fts MATCH ? ORDER BY patients_fts.rank LIMIT ?",
+            (" OR ".join(self.database.phrase(trigram) for trigram in inner), candidates))
+        scored = []
+        for row in rows:
+            similarity = TrigramIndex.similarity(query_trigrams, row[1].casefold())
+            if similarity >= threshold:
+                scored.append((-similarity, len(row[1]), row))
+        scored.sort(key=lambda match: match[:2])
+        return [self._patient(row) for _, _, row in scored[:limit]]
+
+    def update_patient(self, key: int, updated_patient: Patient) -> bool:
+        """ updates a patient's information if they exist, using the provided Patient object."""
+        cursor = self.database.connection().execute(
+            "UPDATE patients SET name = ?, birth_date = ?, phone = ?, email = ?, address = ?, name_key = ?, "
+            "phone_key = ?, email_key = ? WHERE phn = ?",
+            (updated_patient.name, updated_patient.birth_date, updated_patient.phone,
+             updated_patient.email, updated_patient.address, updated_patient.name.casefold(),
+             phone_key(updated_patient.phone), email_key(updated_patient.email), key))
+        return cursor.rowcount > 0
+
+    def delete_patient(self, phn: int) -> bool:
+        """ deletes a patient by PHN if found."""
+        cursor = self.database.connection().execute("DELETE FROM patients WHERE phn = ?", (phn,))
+        return cursor.rowcount > 0
+
+    def version(self) -> tuple[str, float]:
+        """ returns a token that changes whenever the patients change, and the time they last changed"""
+        epoch, version, modified = self.database.connection().execute(
+            "SELECT epoch, version, modified FROM patients_version").fetchone()
+        return f"{epoch}-{version}", modified
+
+    def list_patients(self) -> [Patient]:
+        """ returns a list of all patients."""
+        rows = self.database.connection().execute(f"SELECT {COLUMNS} FROM patients ORDER BY id")
+        return [self._patient(row) for row in rows]
+
+    def list_patients_page(self, after_phn: int = None, limit: int = 100) -> [Patient]:
+        """ returns up to limit patients with a PHN greater than after_phn, in PHN order."""
+        rows = self.database.connection().execute(
+            f"SELECT {COLUMNS} FROM patients WHERE phn > ? ORDER BY phn LIMIT ?",
+            (-1 if after_phn is None else after_phn, limit))
+        return [self._patient(row) for row in rows]
+
+    def retrieve_patients_page(self, name: str, after: tuple = None, limit: int = 100) -> [Patient]:
+        """ returns up to limit patients matching the given name whose name key follows after, in name key order."""
+        if after is None:
+            clauses, parameters = "ORDER BY p.name_key, p.phn LIMIT ?", (limit,)
+        else:
+            clauses, parameters = "AND (p.name_key, p.phn) > (?, ?) ORDER BY p.name_key, p.phn LIMIT ?", (*after, limit)
+        return [self._patient(row) for row in self._matching(name, clauses, parameters)]
+
+    def autocomplete(self, prefix: str, limit: int = 10) -> [Patient]:
+        """ returns up to limit patients whose name starts with prefix, ignoring case, in name key order."""
+        folded = prefix.casefold()
+        upper = self.prefix_end(folded)
+        # a range on the name key index, text compares by code point like the bound does
+        if upper is None:
+            rows = self.database.connection().execute(
+                f"SELECT {COLUMNS} FROM patients WHERE name_key >= ? ORDER BY name_key, phn LIMIT ?", (folded, limit))
+        else:
+            rows = self.database.connection().execute(
+                f"SELECT {COLUMNS} FROM patients WHERE name_key >= ? AND name_key < ? ORDER BY name_key, phn LIMIT ?",
+                (folded, upper, limit))
+        return [self._patient(row) for row in rows]
+
+    @staticmethod
+    def prefix_end(prefix: str) -> str:
+        """ returns the least string greater than every string starting with prefix, or None if there is none"""
+        prefix = prefix.rstrip(chr(0x10FFFF))
+        if not prefix:
+            return None
+        following = ord(prefix[-1]) + 1
+        if 0xD800 <= following <= 0xDFFF:
+            following = 0xE000
+        return prefix[:-1] + chr(following)
+
+    def retrieve_patients_by_phone(self, phone: str) -> [Patient]:
+        """ returns the patients with the given phone number, ignoring formatting, in PHN order."""
+        key = phone_key(phone)
+        if not key:
+            return []
+        rows = self.database.connection().execute(
+            f"SELECT {COLUMNS} FROM patients WHERE phone_key = ? ORDER BY phn", (key,))
+        return [self._patient(row) for row in rows]
+
+    def retrieve_patients_by_email(self, email: str) -> [Patient]:
+        """ returns the patients with the given email address, ignoring case, in PHN order."""
+        key = email_key(email)
+        if not key:
+            return []
+        rows = self.database.connection().execute(
+            f"SELECT {COLUMNS} FROM patients WHERE email_key = ? ORDER BY phn", (key,))
+        return [self._patient(row) for row in rows]
+
+    def retrieve_patients_born_between(self, after: str = None, before: str = None) -> [Patient]:
+        """ returns the patients born on or after after and on or before before, ISO dates that are open when None, in birth date order."""
+        # both bounds are bound even when open, so the range always scans the birth date index, undated patients are in no range
+        rows = self.database.connection().execute(
+            f"SELECT {COLUMNS} FROM patients WHERE birth_date >= ? AND birth_date > '' AND birth_date <= ? "
+            "ORDER BY birth_date, phn",
+            ("" if after is None else after, chr(0x10FFFF) if before is None else before))
+        return [self._patient(row) for row in rows]
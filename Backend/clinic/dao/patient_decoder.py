@@ -2,7 +2,9 @@ from json import JSONDecoder
 from clinic.patient import Patient
 
 class PatientDecoder(JSONDecoder):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, flusher=None, note_stores=None, **kwargs):
+        self.flusher = flusher
+        self.note_stores = note_stores
         super().__init__(object_hook=self.object_hook, *args, **kwargs)
 
     def object_hook(self, dct):
@@ -15,6 +17,8 @@ class PatientDecoder(JSONDecoder):
                 dct['phone'],
                 dct['email'],
                 dct['address'],
-                autosave = dct.get('autosave', False)
+                autosave = dct.get('autosave', False),
+                flusher = self.flusher,
+                note_stores = self.note_stores
             )
         return dct
\ No newline at end of file
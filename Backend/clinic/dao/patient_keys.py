@@ -0,0 +1,20 @@
+import re
+
+NON_DIGITS = re.compile(r"\D")
+
+
+def phone_key(phone: str) -> str:
+    """ returns the digits of a phone number, without the North American country code, empty for no number"""
+    phone = phone or ""
+    digits = NON_DIGITS.sub("", phone)
+    if len(digits) == 11 and digits.startswith("1"):
+        digits = digits[1:]
+    # an already normalized number is its own key, so the index shares the patient's string
+    return phone if digits == phone else digits
+
+
+def email_key(email: str) -> str:
+    """ returns the email address trimmed and case-folded, the form addresses are compared in, empty for no address"""
+    email = email or ""
+    key = email.strip().casefold()
+    return email if key == email else key
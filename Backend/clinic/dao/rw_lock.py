@@ -0,0 +1,64 @@
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    """ lets any number of readers in at once, or a single writer. Waiting writers hold off new readers
+    so a steady stream of searches cannot starve a mutation. Both sides are reentrant and the writing
+    thread may also read, but a reader cannot upgrade to writing."""
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._waiting_writers = 0
+        self._writer = None
+        self._local = threading.local()
+
+    @contextmanager
+    def read(self):
+        depth = getattr(self._local, "read_depth", 0)
+        if depth or self._writer == threading.get_ident():
+            self._local.read_depth = depth + 1
+            try:
+                yield
+            finally:
+                self._local.read_depth = depth
+            return
+
+        with self._condition:
+            while self._writer is not None or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        self._local.read_depth = 1
+        try:
+            yield
+        finally:
+            self._local.read_depth = 0
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        if self._writer == me:
+            yield
+            return
+        if getattr(self._local, "read_depth", 0):
+            raise RuntimeError("a read lock cannot be upgraded to a write lock")
+
+        with self._condition:
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = None
+                self._condition.notify_all()
@@ -0,0 +1,84 @@
+import threading
+from collections import OrderedDict
+
+
+class SearchCache:
+    def __init__(self, capacity = 256, max_keys = 1000000) -> None:
+        self.capacity = capacity
+        # queries as short as one letter match most patients, so the cached keys are bounded too
+        self.max_keys = max_keys
+        self._cached_keys = 0
+        self.hits = 0
+        self.prefix_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, query: str) -> list:
+        """ returns the cached keys for the case-folded query, or None"""
+        with self._lock:
+            keys = self._results.get(query)
+            if keys is not None:
+                self.hits += 1
+                self._results.move_to_end(query)
+            return keys
+
+    def get_prefix(self, query: str) -> list:
+        """ returns the cached keys of the longest cached prefix of the query, which hold every match of the query, or None"""
+        with self._lock:
+            for end in range(len(query) - 1, 0, -1):
+                keys = self._results.get(query[:end])
+                if keys is not None:
+                    self.prefix_hits += 1
+                    self._results.move_to_end(query[:end])
+                    return keys
+
+            self.misses += 1
+            return None
+
+    def put(self, query: str, keys: list) -> None:
+        """ caches the keys matching the case-folded query and evicts the least recently used queries over capacity
+        or over max_keys cached keys, results with more than max_keys keys are not cached"""
+        if len(keys) > self.max_keys:
+            return
+
+        with self._lock:
+            previous = self._results.pop(query, None)
+            if previous is not None:
+                self._cached_keys -= len(previous)
+            self._results[query] = keys
+            self._cached_keys += len(keys)
+            while len(self._results) > self.capacity or self._cached_keys > self.max_keys:
+                _, evicted = self._results.popitem(last=False)
+                self._cached_keys -= len(evicted)
+
+    def invalidate(self, name: str) -> None:
+        """ drops the cached queries whose results could include or exclude a patient with this name"""
+        folded = name.casefold()
+        with self._lock:
+            stale = [query for query in self._results if query in folded]
+            for query in stale:
+                self._cached_keys -= len(self._results.pop(query))
+            self.invalidations += len(stale)
+
+    def clear(self) -> None:
+        """ drops every cached query"""
+        with self._lock:
+            self.invalidations += len(self._results)
+            self._results.clear()
+            self._cached_keys = 0
+
+    def stats(self) -> dict:
+        """ returns the cache counters and current size"""
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "cached_queries": len(self._results),
+                "max_keys": self.max_keys,
+                "cached_keys": self._cached_keys,
+                "hits": self.hits,
+                "prefix_hits": self.prefix_hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
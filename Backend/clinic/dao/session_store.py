@@ -0,0 +1,17 @@
+from abc import ABC, abstractmethod
+
+
+class SessionStore(ABC):
+    """ maps a user to the PHN of their current patient, forgetting entries after ttl seconds"""
+
+    @abstractmethod
+    def get_current_patient(self, user_id):
+        pass
+
+    @abstractmethod
+    def set_current_patient(self, user_id, phn):
+        pass
+
+    @abstractmethod
+    def unset_current_patient(self, user_id):
+        pass
@@ -0,0 +1,37 @@
+import threading
+import time
+from clinic.dao.session_store import SessionStore
+
+
+class SessionStoreMemory(SessionStore):
+    """ keeps sessions in this process only, so every worker has its own"""
+
+    def __init__(self, ttl = 8 * 60 * 60) -> None:
+        self.ttl = ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get_current_patient(self, user_id):
+        with self._lock:
+            entry = self._sessions.get(str(user_id))
+            if entry is None:
+                return None
+
+            phn, expires_at = entry
+            if expires_at <= time.time():
+                del self._sessions[str(user_id)]
+                return None
+        return phn
+
+    def set_current_patient(self, user_id, phn) -> None:
+        now = time.time()
+        with self._lock:
+            self._sessions[str(user_id)] = (phn, now + self.ttl)
+            # sessions are set rarely, so sweeping here keeps abandoned ones from piling up
+            expired = [key for key, (_, expires_at) in self._sessions.items() if expires_at <= now]
+            for key in expired:
+                del self._sessions[key]
+
+    def unset_current_patient(self, user_id) -> None:
+        with self._lock:
+            self._sessions.pop(str(user_id), None)
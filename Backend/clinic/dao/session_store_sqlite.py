@@ -0,0 +1,55 @@
+import sqlite3
+import threading
+import time
+from clinic.dao.session_store import SessionStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS current_patients (
+    user_id TEXT PRIMARY KEY,
+    phn INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS current_patients_expires_at ON current_patients (expires_at);
+"""
+
+
+class SessionStoreSQLite(SessionStore):
+    """ keeps sessions in a SQLite file shared by every worker process on the host"""
+
+    def __init__(self, filepath = "./clinic/sessions.sqlite3", ttl = 8 * 60 * 60) -> None:
+        self.filepath = str(filepath)
+        self.ttl = ttl
+        self._local = threading.local()
+        self.connection().executescript(SCHEMA)
+
+    def connection(self) -> sqlite3.Connection:
+        """ returns this thread's connection, opening it in WAL mode on first use"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.filepath, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get_current_patient(self, user_id):
+        row = self.connection().execute(
+            "SELECT phn FROM current_patients WHERE user_id = ? AND expires_at > ?",
+            (str(user_id), time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_current_patient(self, user_id, phn) -> None:
+        now = time.time()
+        connection = self.connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute(
+                "INSERT INTO current_patients (user_id, phn, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET phn = excluded.phn, expires_at = excluded.expires_at",
+                (str(user_id), phn, now + self.ttl),
+            )
+            connection.execute("DELETE FROM current_patients WHERE expires_at <= ?", (now,))
+
+    def unset_current_patient(self, user_id) -> None:
+        self.connection().execute("DELETE FROM current_patients WHERE user_id = ?", (str(user_id),))
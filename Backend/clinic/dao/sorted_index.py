@@ -0,0 +1,46 @@
+from bisect import bisect_left, bisect_right, insort
+
+
+class SortedIndex:
+    def __init__(self) -> None:
+        self._keys = []
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key) -> None:
+        """ inserts key in sorted position"""
+        insort(self._keys, key)
+
+    def remove(self, key) -> None:
+        """ removes key if present"""
+        position = bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            del self._keys[position]
+
+    def clear(self) -> None:
+        """ empties the index"""
+        self._keys.clear()
+
+    def after(self, key, limit: int) -> list:
+        """ returns up to limit keys greater than key in ascending order, from the start if key is None"""
+        start = 0 if key is None else bisect_right(self._keys, key)
+        return self._keys[start:start + limit]
+
+    def iterate_after(self, key):
+        """ yields the keys greater than key in ascending order, from the start if key is None.
+        The index must not change while the caller iterates."""
+        start = 0 if key is None else bisect_right(self._keys, key)
+        for position in range(start, len(self._keys)):
+            yield self._keys[position]
+
+    def starting_at(self, key, limit: int) -> list:
+        """ returns up to limit keys not less than key in ascending order"""
+        start = bisect_left(self._keys, key)
+        return self._keys[start:start + limit]
+
+    def between(self, low, high) -> list:
+        """ returns the keys from low to high inclusive in ascending order, unbounded on a side that is None"""
+        start = 0 if low is None else bisect_left(self._keys, low)
+        end = len(self._keys) if high is None else bisect_right(self._keys, high)
+        return self._keys[start:end]
@@ -0,0 +1,126 @@
+import sqlite3
+import threading
+from clinic.dao.patient_keys import phone_key, email_key
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    phn INTEGER NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    birth_date TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    email TEXT NOT NULL,
+    address TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    phone_key TEXT NOT NULL DEFAULT '',
+    email_key TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS patients_name_key ON patients (name_key, phn);
+CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5(
+    name, content='patients', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS patients_fts_insert AFTER INSERT ON patients BEGIN
+    INSERT INTO patients_fts(rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS patients_fts_delete AFTER DELETE ON patients BEGIN
+    INSERT INTO patients_fts(patients_fts, rowid, name) VALUES ('delete', old.id, old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS patients_fts_update AFTER UPDATE OF name ON patients BEGIN
+    INSERT INTO patients_fts(patients_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    INSERT INTO patients_fts(rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TABLE IF NOT EXISTS patients_version (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    epoch TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    modified REAL NOT NULL
+);
+INSERT OR IGNORE INTO patients_version VALUES (0, lower(hex(randomblob(6))), 0, (julianday('now') - 2440587.5) * 86400.0);
+CREATE TRIGGER IF NOT EXISTS patients_version_insert AFTER INSERT ON patients BEGIN
+    UPDATE patients_version SET version = version + 1, modified = (julianday('now') - 2440587.5) * 86400.0;
+END;
+CREATE TRIGGER IF NOT EXISTS patients_version_delete AFTER DELETE ON patients BEGIN
+    UPDATE patients_version SET version = version + 1, modified = (julianday('now') - 2440587.5) * 86400.0;
+END;
+CREATE TRIGGER IF NOT EXISTS patients_version_update AFTER UPDATE ON patients BEGIN
+    UPDATE patients_version SET version = version + 1, modified = (julianday('now') - 2440587.5) * 86400.0;
+END;
+
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    phn INTEGER NOT NULL,
+    code INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    UNIQUE (phn, code)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+    text, content='notes', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+    INSERT INTO notes_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+    INSERT INTO notes_fts(notes_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE OF text ON notes BEGIN
+    INSERT INTO notes_fts(notes_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO notes_fts(rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+# created after UPGRADE_COLUMNS were added to a database from before them
+KEY_INDEXES = """
+CREATE INDEX IF NOT EXISTS patients_phone_key ON patients (phone_key);
+CREATE INDEX IF NOT EXISTS patients_email_key ON patients (email_key);
+CREATE INDEX IF NOT EXISTS patients_birth_date ON patients (birth_date, phn);
+"""
+UPGRADE_COLUMNS = ("phone_key", "email_key")
+
+
+class SQLiteDatabase:
+    def __init__(self, filepath = "./clinic/clinic.sqlite3") -> None:
+        self.filepath = str(filepath)
+        self._local = threading.local()
+        connection = self.connection()
+        connection.executescript(SCHEMA)
+        self.upgrade(connection)
+        connection.executescript(KEY_INDEXES)
+
+    @staticmethod
+    def upgrade(connection: sqlite3.Connection) -> None:
+        """ adds the lookup key columns to a patients table created before them and fills them in"""
+        def missing_columns() -> list:
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(patients)")}
+            return [column for column in UPGRADE_COLUMNS if column not in columns]
+
+        if not missing_columns():
+            return
+
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            # another process may have upgraded the table while this one waited for the write lock
+            missing = missing_columns()
+            for column in missing:
+                connection.execute(f"ALTER TABLE patients ADD COLUMN {column} TEXT NOT NULL DEFAULT ''")
+            if not missing:
+                return
+            rows = connection.execute("SELECT phn, phone, email FROM patients").fetchall()
+            connection.executemany("UPDATE patients SET phone_key = ?, email_key = ? WHERE phn = ?",
+                                   ((phone_key(phone), email_key(email), phn) for phn, phone, email in rows))
+
+    def connection(self) -> sqlite3.Connection:
+        """ returns this thread's connection, opening it in WAL mode on first use"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # statements are parameterised constants, so the statement cache keeps them prepared
+            connection = sqlite3.connect(self.filepath, cached_statements=256, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def phrase(text: str) -> str:
+        """ returns text quoted as a single FTS5 phrase"""
+        return '"' + text.replace('"', '""') + '"'
@@ -0,0 +1,114 @@
+import heapq
+from collections import Counter
+from math import ceil
+
+EMPTY = frozenset()
+
+
+class TrigramIndex:
+    def __init__(self) -> None:
+        self._postings = {}
+        self._texts = {}
+        self._sequence = {}
+        self._counter = 0
+
+    @staticmethod
+    def trigrams(text: str) -> set:
+        """ returns the set of three character substrings of the text"""
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    @classmethod
+    def padded_trigrams(cls, text: str) -> set:
+        """ returns the trigrams of the text with a space at each end, so the start and end of a name count too"""
+        return cls.trigrams(f" {text} ")
+
+    @classmethod
+    def similarity(cls, query_trigrams: set, text: str) -> float:
+        """ returns the share of the query's padded trigrams that the case-folded text also has"""
+        return len(query_trigrams & cls.padded_trigrams(text)) / len(query_trigrams)
+
+    def add(self, key, text: str) -> None:
+        """ indexes the case-folded text under key, keeping the key's original position if it is re-indexed"""
+        if key in self._texts:
+            self._unlink(key)
+        else:
+            self._counter += 1
+            self._sequence[key] = self._counter
+
+        folded = text.casefold()
+        # keep the caller's string when it is already folded, rather than an equal copy
+        folded = text if folded == text else folded
+        self._texts[key] = folded
+        for trigram in self.padded_trigrams(folded):
+            self._postings.setdefault(trigram, set()).add(key)
+
+    def remove(self, key) -> None:
+        """ removes key from the index if present"""
+        if key in self._texts:
+            self._unlink(key)
+            del self._texts[key]
+            del self._sequence[key]
+
+    def clear(self) -> None:
+        """ empties the index"""
+        self._postings.clear()
+        self._texts.clear()
+        self._sequence.clear()
+
+    def contains(self, key, folded_query: str) -> bool:
+        """ returns whether the text indexed under key contains the already case-folded query"""
+        return folded_query in self._texts.get(key, "")
+
+    def search(self, query: str) -> list:
+        """ returns the keys whose text contains the query, most recently added first"""
+        folded = query.casefold()
+        if len(folded) < 3:
+            matches = [key for key, text in self._texts.items() if folded in text]
+        else:
+            postings = []
+            for trigram in self.trigrams(folded):
+                posting = self._postings.get(trigram)
+                if not posting:
+                    return []
+                postings.append(posting)
+
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                candidates &= posting
+                if not candidates:
+                    return []
+
+            matches = [key for key in candidates if folded in self._texts[key]]
+
+        matches.sort(key=self._sequence.__getitem__, reverse=True)
+        return matches
+
+    def similar(self, query: str, threshold: float = 0.4, limit: int = 100) -> list:
+        """ returns (key, similarity) for up to limit keys whose text has at least threshold of the query's padded trigrams, most similar first"""
+        query_trigrams = self.padded_trigrams(query.casefold())
+        if not query_trigrams:
+            return []
+
+        postings = sorted((self._postings.get(trigram, EMPTY) for trigram in query_trigrams), key=len)
+        required = max(1, ceil(threshold * len(postings)))
+        # a key missing from all of the smallest len - required + 1 postings cannot reach required,
+        # so only those are read in full and the larger ones are only intersected with their keys
+        split = len(postings) - required + 1
+        counts = Counter()
+        for posting in postings[:split]:
+            counts.update(posting)
+        for posting in postings[split:]:
+            counts.update(posting.intersection(counts))
+
+        matches = ((key, shared / len(postings)) for key, shared in counts.items() if shared >= required)
+        # among equally similar names the shorter ones have fewer extra trigrams and are the closer match
+        return heapq.nsmallest(limit, matches, key=lambda match: (-match[1], len(self._texts[match[0]]), -self._sequence[match[0]]))
+
+    def _unlink(self, key) -> None:
+        """ drops key from the posting lists of its current text"""
+        for trigram in self.padded_trigrams(self._texts[key]):
+            posting = self._postings[trigram]
+            posting.discard(key)
+            if not posting:
+                del self._postings[trigram]
@@ -0,0 +1,69 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindFlusher:
+    def __init__(self, interval_ms = 200, max_changes = 100) -> None:
+        self.interval = interval_ms / 1000
+        self.max_changes = max_changes
+        self._pending = {}
+        self._changes = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="write-behind-flusher", daemon=True)
+        self._thread.start()
+
+    def mark_dirty(self, key: str, save) -> None:
+        """ records that the store identified by key has changes that save() will persist"""
+        with self._condition:
+            if not self._closed:
+                self._pending[key] = save
+                self._changes += 1
+                if self._changes == 1 or self._changes >= self.max_changes:
+                    self._condition.notify()
+                return
+
+        # nobody is left to flush once closed, so write through
+        save()
+
+    def flush(self) -> None:
+        """ writes every pending store now, coalescing all changes made since the last flush"""
+        with self._flush_lock:
+            with self._condition:
+                pending = self._pending
+                self._pending = {}
+                self._changes = 0
+
+            for key, save in pending.items():
+                try:
+                    save()
+                except Exception:
+                    logger.exception("Write-behind flush failed for %s", key)
+                    with self._condition:
+                        self._pending.setdefault(key, save)
+
+    def close(self) -> None:
+        """ stops the background thread and writes whatever is still pending"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self.flush()
+
+    def _run(self) -> None:
+        """ waits for changes and flushes them every interval or every max_changes changes"""
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                if self._changes < self.max_changes:
+                    self._condition.wait(self.interval)
+                if self._closed:
+                    return
+
+            self.flush()
@@ -0,0 +1,2 @@
+class InvalidNoteFileException(Exception):
+	''' Invalid Note File '''
\ No newline at end of file
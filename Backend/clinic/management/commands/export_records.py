@@ -0,0 +1,39 @@
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from clinic.dao.patient_dao_json import PatientDAOJSON
+from clinic.dao.patient_dao_sqlite import PatientDAOSQLite
+from clinic.dao.sqlite_database import SQLiteDatabase
+from clinic.patient_export import iter_records, ndjson_chunks, gzip_chunks
+
+
+class Command(BaseCommand):
+    help = "Writes every patient followed by their notes as NDJSON, streaming so memory use stays flat"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default="-", help="file to write, - for standard output")
+        parser.add_argument("--gzip", action="store_true", help="compress the output with gzip")
+
+    def handle(self, *args, **options):
+        storage = settings.CLINIC_STORAGE
+        if storage["BACKEND"] == "sqlite":
+            patient_dao = PatientDAOSQLite(SQLiteDatabase(storage["SQLITE_PATH"]))
+        else:
+            patient_dao = PatientDAOJSON(autosave=True, journal=storage["JOURNAL"])
+
+        chunks = ndjson_chunks(iter_records(patient_dao))
+        if options["gzip"]:
+            chunks = gzip_chunks(chunks)
+
+        if options["output"] == "-":
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+
+        size = 0
+        with open(options["output"], "wb") as file:
+            for chunk in chunks:
+                file.write(chunk)
+                size += len(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {size} bytes to {options['output']}"))
@@ -0,0 +1,43 @@
+import glob
+import os
+import pickle
+from django.core.management.base import BaseCommand
+from clinic.dao.note_file import write_notes
+
+
+class Command(BaseCommand):
+    help = "Converts pickled note records (<phn>.dat) to the binary note format (<phn>.bin)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--records-dir", default="./clinic/records", help="directory holding the note records")
+        parser.add_argument("--overwrite", action="store_true", help="replace .bin files that already exist")
+        parser.add_argument("--delete", action="store_true", help="remove each .dat file once it is converted")
+
+    def handle(self, *args, **options):
+        converted = 0
+        skipped = 0
+        for source in sorted(glob.glob(os.path.join(options["records_dir"], "*.dat"))):
+            target = source[:-len(".dat")] + ".bin"
+            if os.path.exists(target) and not options["overwrite"]:
+                self.stdout.write(f"Skipping {source}: {target} already exists")
+                skipped += 1
+                continue
+            journal = source[:-len(".dat")] + ".log"
+            if os.path.exists(target) and os.path.exists(journal):
+                # the snapshot and its journal hold notes written since the upgrade, the .dat file has none of them
+                self.stdout.write(f"Skipping {source}: {target} has a journal, {journal}, and would lose its notes")
+                skipped += 1
+                continue
+
+            with open(source, "rb") as file:
+                try:
+                    notes = pickle.load(file)
+                except EOFError:
+                    notes = []
+
+            write_notes(target, notes)
+            if options["delete"]:
+                os.remove(source)
+            converted += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Converted {converted} note records, skipped {skipped}"))
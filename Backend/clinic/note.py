@@ -1,9 +1,31 @@
 import datetime
 class Note:
+    # no per-instance __dict__, and the time is kept as epoch seconds rather than a datetime object
+    __slots__ = ("code", "text", "_timestamp")
+
     def __init__(self, code: int, text: str) -> None:
         self.code = code
         self.text = text
-        self.timestamp = datetime.datetime.now()
+        self._timestamp = datetime.datetime.now().timestamp()
+
+    @property
+    def timestamp(self) -> datetime.datetime:
+        """ returns the local time the note was last written"""
+        return datetime.datetime.fromtimestamp(self._timestamp)
+
+    @timestamp.setter
+    def timestamp(self, value: datetime.datetime) -> None:
+        self._timestamp = value.timestamp()
+
+    def __getstate__(self) -> dict:
+        """ returns the attributes notes were pickled with before they had slots, so old and new pickles read alike"""
+        return {"code": self.code, "text": self.text, "timestamp": self.timestamp}
+
+    def __setstate__(self, state: dict) -> None:
+        """ restores a note from a pickle, including ones written before notes had slots"""
+        self.code = state["code"]
+        self.text = state["text"]
+        self.timestamp = state["timestamp"]
 
     def __eq__(self, other) -> bool:
         """ returns true if two notes are equal"""
@@ -18,5 +40,5 @@ class Note:
 
     def update_note(self, txt: str) -> None:
         """ updates the note with the given string and its timestamp"""
-        self.timestamp = datetime.datetime.now()
-        self.text = txt
\ No newline at end of file
+        self._timestamp = datetime.datetime.now().timestamp()
+        self.text = txt
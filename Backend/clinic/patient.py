@@ -1,8 +1,22 @@
+import json
+import sys
 from clinic.patient_record import PatientRecord
 from clinic.note import Note
 
+# encodes like DRF's JSONRenderer with its default compact, unicode and strict settings
+JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+
+
+def field_json(value, to_representation = str):
+    """ returns a field value as a serializer field represents it, None stays None like Serializer.to_representation keeps it"""
+    return None if value is None else to_representation(value)
+
 
 class Patient:
+    # no per-instance __dict__, the fields below are all a patient holds
+    __slots__ = ("autosave", "phn", "name", "birth_date", "phone", "email", "address",
+                 "_flusher", "_note_stores", "_database", "_patient_records", "_json", "_version")
+
     def __init__(self,
                  phn: int,
                  name: str,
@@ -10,15 +24,26 @@ class Patient:
                  phone: str,
                  email: str,
                  address: str,
-                 autosave = False) -> None:
+                 autosave = False,
+                 flusher = None,
+                 note_stores = None,
+                 database = None) -> None:
         self.autosave = autosave
         self.phn = phn
         self.name = name
-        self.birth_date = birth_date
+        # few distinct birth dates are shared by many patients, so they share one string each
+        self.birth_date = sys.intern(birth_date) if isinstance(birth_date, str) else birth_date
         self.phone = phone
         self.email = email
         self.address = address
-        self.patient_records = PatientRecord(phn, self.autosave)
+        self._flusher = flusher
+        self._note_stores = note_stores
+        self._database = database
+        # built on first access so loading patients does not open every note file
+        self._patient_records = None
+        # (version, bytes) of the rendered patient, only valid while version matches
+        self._json = None
+        self._version = 0
 
     def __eq__(self, other) -> bool:
         """ returns true if both patient are equal"""
@@ -45,10 +70,30 @@ class Patient:
                         address: str ) -> None:
         """ updates patient data"""
         self.name = name
-        self.birth_date = birth_date
+        self.birth_date = sys.intern(birth_date) if isinstance(birth_date, str) else birth_date
         self.phone = phone
         self.email = email
         self.address = address
+        self.clear_json()
+
+    def to_json(self) -> bytes:
+        """ returns the patient as PatientSerializer data rendered by DRF's JSON renderer, cached until the data changes"""
+        cached = self._json
+        if cached is not None and cached[0] == self._version:
+            return cached[1]
+
+        # read the version first, a concurrent update bumps it after changing the fields
+        version = self._version
+        text = JSON_ENCODER.encode({"phn": field_json(self.phn, int), "name": field_json(self.name),
+                                    "birth_date": field_json(self.birth_date), "phone": field_json(self.phone),
+                                    "email": field_json(self.email), "address": field_json(self.address)})
+        rendered = text.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029").encode("utf-8")
+        self._json = (version, rendered)
+        return rendered
+
+    def clear_json(self) -> None:
+        """ drops the cached rendering"""
+        self._version += 1
 
     def __str__(self) -> str:
         """ returns patient string"""
@@ -61,8 +106,25 @@ class Patient:
         result += " Address: " + self.address
         return result
 
+    @property
+    def patient_records(self) -> PatientRecord:
+        """ returns patient records, creating them on first access"""
+        return self.get_patient_records()
+
     def get_patient_records(self) -> PatientRecord:
-        """ returns patient records"""
-        return self.patient_records
+        """ returns patient records, creating them on first access"""
+        if self._patient_records is None:
+            self._patient_records = PatientRecord(self.phn, self.autosave, self._flusher, self._note_stores, self._database)
+        return self._patient_records
+
+    def iter_notes(self):
+        """ yields the patient's notes in code order, without creating or filling the patient's records"""
+        # a throwaway record outside the note store cache, so exporting every patient does not load every note file
+        records = self._patient_records or PatientRecord(self.phn, self.autosave, self._flusher, None, self._database)
+        return records.iter_notes()
+
+    def has_loaded_records(self) -> bool:
+        """ returns true if the patient's notes have been read into memory"""
+        return self._patient_records is not None and self._patient_records.is_loaded()
 
 
@@ -0,0 +1,48 @@
+import json
+import zlib
+
+CHUNK_SIZE = 64 * 1024
+# one encoder for every record, json.dumps would build a new one per call
+ENCODER = json.JSONEncoder(ensure_ascii=False)
+
+
+def iter_records(patient_dao, page_size: int = 500):
+    """ yields an export record for each patient, in PHN order, followed by one for each of their notes"""
+    after_phn = None
+    while True:
+        patients = patient_dao.list_patients_page(after_phn, page_size)
+        for patient in patients:
+            yield {"type": "patient", "phn": patient.phn, "name": patient.name, "birth_date": patient.birth_date,
+                   "phone": patient.phone, "email": patient.email, "address": patient.address}
+            for note in patient.iter_notes():
+                yield {"type": "note", "phn": patient.phn, "code": note.code, "text": note.text,
+                       "timestamp": note.timestamp.isoformat()}
+        if len(patients) < page_size:
+            return
+        after_phn = patients[-1].phn
+
+
+def ndjson_chunks(records, chunk_size: int = CHUNK_SIZE):
+    """ yields the records as NDJSON, in chunks of about chunk_size bytes"""
+    buffer = []
+    size = 0
+    for record in records:
+        line = ENCODER.encode(record).encode("utf-8") + b"\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def gzip_chunks(chunks, level: int = 6):
+    """ yields the chunks compressed as a single gzip stream"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,32 @@
+import csv
+import json
+
+# the create endpoint takes birthDate, imports accept it as well as the serializer's birth_date
+ALIASES = {"birthDate": "birth_date"}
+
+
+def normalize(row: dict) -> dict:
+    """ returns the row with aliased field names replaced by the serializer's"""
+    for alias, field in ALIASES.items():
+        if alias in row and field not in row:
+            row[field] = row.pop(alias)
+    return row
+
+
+def read_ndjson(lines):
+    """ yields (line number, row) for each non-blank line of an NDJSON stream, row is None if the line is not a JSON object"""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, normalize(row) if isinstance(row, dict) else None
+
+
+def read_csv(lines):
+    """ yields (line number, row) for each record of a CSV stream that starts with a header line"""
+    reader = csv.DictReader(line.decode("utf-8") if isinstance(line, bytes) else line for line in lines)
+    for row in reader:
+        yield reader.line_num, normalize(row)
@@ -1,14 +1,22 @@
 
 from clinic.note import Note
-from clinic.dao.note_dao_pickle import NoteDAOPickle
+from clinic.dao.note_dao_binary import NoteDAOBinary
+from clinic.dao.note_dao_sqlite import NoteDAOSQLite
 
 
 class PatientRecord:
-    def __init__(self, phn: int, autosave = False ) -> None:
+    def __init__(self, phn: int, autosave = False, flusher = None, note_stores = None, database = None) -> None:
         self.autosave = autosave
         self.phn = str(phn)
-        self._note_dao = NoteDAOPickle(self.phn, self.autosave)
+        if database:
+            self._note_dao = NoteDAOSQLite(self.phn, database)
+        else:
+            self._note_dao = NoteDAOBinary(self.phn, self.autosave, flusher, note_stores)
     
+    def is_loaded(self) -> bool:
+        """ returns true if the notes of this record have been read into memory"""
+        return self._note_dao.is_loaded()
+
     def add_note(self, note: str) -> Note:
         """returns and adds a new note to the list of notes"""
         return self._note_dao.create_note(note)
@@ -17,10 +25,10 @@ class PatientRecord:
         """ returns the note with the given id"""
         return self._note_dao.search_note(id)
 
-    def get_notes_by_text(self, text: str) -> [Note]:
-        """ returns list of notes with the given text"""
+    def get_notes_by_text(self, text: str, limit: int = None) -> [Note]:
+        """ returns list of notes matching the given text, best match first, at most limit notes"""
 
-        return self._note_dao.retrieve_notes(text)
+        return self._note_dao.retrieve_notes(text, limit)
 
     def update_note(self, id: int, note: str) -> bool:
         """ return and updates the note with the given id if it exists"""
@@ -34,6 +42,10 @@ class PatientRecord:
         """ returns list of notes in reverse order"""
         return self._note_dao.list_notes()
 
+    def iter_notes(self):
+        """ yields the notes in code order without keeping them all in memory"""
+        return self._note_dao.iter_notes()
+
 
 
 
@@ -1,3 +1,314 @@
-from django.test import TestCase
+import io
+import os
+import pickle
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import RefreshToken
+from clinic.controller import Controller
+from clinic.dao.note_dao_pickle import NoteDAOPickle
+from clinic.dao.note_dao_sqlite import NoteDAOSQLite
+from clinic.dao.patient_dao_json import PatientDAOJSON
+from clinic.dao.patient_dao_sqlite import PatientDAOSQLite
+from clinic.dao.sqlite_database import SQLiteDatabase
+from clinic.note import Note
+from clinic.patient import Patient
+from clinic.patient_record import PatientRecord
+from clinic.serializers import PatientSerializer
 
-# Create your tests here.
+PARITY_PATIENTS = [
+    (1001, "Jörg Müller", "1980-02-01", "250-555-0101", "Joerg@Example.com", "1 Main St"),
+    (1002, "JÖRG Öztürk", "1975-06-30", "+1 (250) 555-0102", "jorg@example.com", "2 Main St"),
+    (1003, "Hans Straße", "1990-11-12", "2505550103", "", "3 Main St"),
+    (1004, "Anna Strasse", "1990-11-12", "", "anna@example.com", "4 Main St"),
+    (1005, "İsa Yilmaz", "2001-01-01", "250 555 0105", "isa@example.com", "5 Main St"),
+    (1006, "Isabel Lee", "1969-07-20", "250.555.0106", " ISABEL@example.com ", "6 Main St"),
+    (1007, "Liam Johnson", "1985-03-15", "12505550107", "liam@example.com", "7 Main St"),
+    (1008, "Ava Anderson", "1999-12-31", "250-555-0108", "ava@example.com", "8 Main St"),
+    (1009, "Noah Undated", "", "250-555-0109", "noah@example.com", "9 Main St"),
+]
+
+
+def phns(patients: list) -> list:
+    """ returns the PHNs of the patients in order"""
+    return [patient.phn for patient in patients]
+
+
+def patient_rows(patients: list) -> list:
+    """ returns the fields of the patients, ordered by PHN"""
+    return sorted((patient.phn, patient.name, patient.birth_date, patient.phone, patient.email, patient.address)
+                  for patient in patients)
+
+
+def note_rows(notes: list) -> list:
+    """ returns the codes and texts of the notes, ordered by code"""
+    return sorted((note.code, note.text) for note in notes)
+
+
+class PatientDAOParityTest(TestCase):
+    """ the JSON and SQLite patient stores answer every query alike"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.json_dao = PatientDAOJSON()
+        self.sqlite_dao = PatientDAOSQLite(SQLiteDatabase(os.path.join(self.directory.name, "clinic.sqlite3")))
+        for row in PARITY_PATIENTS:
+            self.json_dao.create_patient(Patient(*row))
+            self.sqlite_dao.create_patient(Patient(*row))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assertParity(self, method: str, *args):
+        json_result = getattr(self.json_dao, method)(*args)
+        sqlite_result = getattr(self.sqlite_dao, method)(*args)
+        self.assertEqual(phns(json_result), phns(sqlite_result), f"{method}{args}")
+
+    def test_short_name_queries_fold_case_beyond_ascii(self):
+        for query in ["", "ö", "Ö", "ß", "ss", "SS", "i̇", "is", "IS", "ü", "an", "x"]:
+            self.assertParity("retrieve_patients", query)
+
+    def test_name_queries(self):
+        # 3 characters or more go to the trigram index, see PatientDAOSQLite._matching for the foldings it misses
+        for query in ["lee", "LEE", "son", "jör", "müller", "nobody"]:
+            self.assertParity("retrieve_patients", query)
+
+    def test_name_pages(self):
+        for query in ["", "s", "an", "son"]:
+            after = None
+            while True:
+                json_page = self.json_dao.retrieve_patients_page(query, after, 2)
+                sqlite_page = self.sqlite_dao.retrieve_patients_page(query, after, 2)
+                self.assertEqual(phns(json_page), phns(sqlite_page), query)
+                if not json_page:
+                    break
+                after = PatientDAOJSON.name_key(json_page[-1])
+
+    def test_lookups(self):
+        self.assertParity("autocomplete", "jö")
+        self.assertParity("autocomplete", "i")
+        self.assertParity("retrieve_patients_by_phone", "(250) 555-0102")
+        self.assertParity("retrieve_patients_by_phone", "1-250-555-0107")
+        self.assertParity("retrieve_patients_by_email", "isabel@EXAMPLE.com")
+        self.assertParity("retrieve_patients_born_between", "1980-01-01", "1990-12-31")
+        self.assertParity("retrieve_patients_born_between", None, "1970-01-01")
+        self.assertParity("retrieve_patients_born_between", None, None)
+        self.assertParity("list_patients_page", 1003, 3)
+
+    def test_undated_patients_are_in_no_birth_date_range(self):
+        self.json_dao.create_patient(Patient(1010, "Nora Undated", None, "250-555-0109", None, "10 Main St"))
+        self.assertEqual(phns(self.json_dao.retrieve_patients_born_between(None, "1970-01-01")), [1006])
+        self.assertNotIn(1009, phns(self.json_dao.retrieve_patients_born_between(None, None)))
+        self.assertNotIn(1010, phns(self.json_dao.retrieve_patients_born_between(None, None)))
+
+        controller = Controller()
+        controller._patient_dao = self.json_dao
+        self.assertEqual(controller._filter_patients("250-555-0109", None, None, "2020-01-01"), [])
+        self.assertEqual(phns(controller._filter_patients("250-555-0109", None, None, None)), [1009, 1010])
+
+    def test_updates_and_deletes(self):
+        for dao in (self.json_dao, self.sqlite_dao):
+            dao.update_patient(1003, Patient(1003, "Hans Öst", "1990-11-12", "", "", "3 Main St"))
+            dao.delete_patient(1005)
+        self.assertParity("retrieve_patients", "ö")
+        self.assertParity("retrieve_patients", "ß")
+        self.assertParity("list_patients")
+        self.assertEqual(self.json_dao.search_patient(1003).name, self.sqlite_dao.search_patient(1003).name)
+
+
+class ControllerStressTest(TestCase):
+    """ many threads sharing one controller leave the patients, their indexes, their notes and the files consistent"""
+
+    THREADS = 16
+    PATIENTS_PER_THREAD = 20
+    NOTES_PER_THREAD = 25
+    SHARED_PHN = 1
+
+    def setUp(self):
+        # the stores write to ./clinic, so each test runs in its own directory
+        self.directory = tempfile.TemporaryDirectory()
+        self.working_directory = os.getcwd()
+        os.makedirs(os.path.join(self.directory.name, "clinic", "records"))
+        os.chdir(self.directory.name)
+        self.requests = []
+        for number in range(self.THREADS):
+            user = User.objects.create_user(f"stress{number}", password="pw12345!")
+            token = RefreshToken.for_user(user).access_token
+            self.requests.append(RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}"))
+
+    def tearDown(self):
+        os.chdir(self.working_directory)
+        self.directory.cleanup()
+
+    def work(self, controller: Controller, number: int) -> None:
+        """ one thread's share: creates, renames, searches and deletes its own patients and adds notes to the shared one"""
+        request = self.requests[number]
+        first_phn = 1000 + number * self.PATIENTS_PER_THREAD
+        for phn in range(first_phn, first_phn + self.PATIENTS_PER_THREAD):
+            controller.create_patient(request, phn, f"Stress Patient {phn}", "1990-01-01",
+                                      f"250555{phn:04}", f"p{phn}@example.com", "1 Main St")
+        controller.set_current_patient(request, self.SHARED_PHN)
+        for index in range(self.NOTES_PER_THREAD):
+            controller.create_note(request, f"thread {number} note {index}")
+            phn = first_phn + index % self.PATIENTS_PER_THREAD
+            if index % 3 == 0:
+                controller.update_patient(request, phn, phn, f"Renamed Patient {phn}", "1991-02-02",
+                                          f"250555{phn:04}", f"p{phn}@example.com", "2 Main St")
+            controller.retrieve_patients(request, "patient")
+            controller.retrieve_patients(request, str(phn))
+        for phn in range(first_phn, first_phn + self.PATIENTS_PER_THREAD, 4):
+            controller.delete_patient(request, phn)
+
+    def stress(self, journal: bool, write_behind: bool) -> None:
+        controller = Controller(autosave=True, journal=journal, write_behind=write_behind)
+        request = self.requests[0]
+        controller.create_patient(request, self.SHARED_PHN, "Shared Patient", "1980-01-01",
+                                  "2505550000", "shared@example.com", "1 Main St")
+        with ThreadPoolExecutor(max_workers=self.THREADS) as pool:
+            for future in [pool.submit(self.work, controller, number) for number in range(self.THREADS)]:
+                future.result()
+
+        codes = sorted(note.code for note in controller.list_notes(request))
+        self.assertEqual(codes, list(range(1, self.THREADS * self.NOTES_PER_THREAD + 1)))
+
+        dao = controller._patient_dao
+        self.assertEqual(dao._name_index._texts, {phn: patient.name.casefold() for phn, patient in dao.patients.items()})
+        self.assertEqual(dao._name_order._keys, sorted(dao.name_key(patient) for patient in dao.patients.values()))
+        for phn, patient in dao.patients.items():
+            self.assertEqual(phns(dao.retrieve_patients(patient.name)), [phn])
+
+        controller.close()
+        loaded = Controller(autosave=True, journal=journal)
+        self.assertEqual(patient_rows(loaded.list_patients(request)), patient_rows(controller.list_patients(request)))
+        loaded.set_current_patient(request, self.SHARED_PHN)
+        self.assertEqual(note_rows(loaded.list_notes(request)), note_rows(controller.list_notes(request)))
+        loaded.close()
+
+    def test_without_journal_or_write_behind(self):
+        self.stress(journal=False, write_behind=False)
+
+    def test_with_journal_and_write_behind(self):
+        self.stress(journal=True, write_behind=True)
+
+
+class LegacyNoteRecordTest(TestCase):
+    """ note records pickled before the binary format stay readable until migrate_notes converts them"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.working_directory = os.getcwd()
+        os.makedirs(os.path.join(self.directory.name, "clinic", "records"))
+        os.chdir(self.directory.name)
+        with open("clinic/records/7.dat", "wb") as file:
+            pickle.dump([Note(1, "legacy one"), Note(2, "legacy two")], file)
+
+    def tearDown(self):
+        os.chdir(self.working_directory)
+        self.directory.cleanup()
+
+    def test_notes_written_before_migrating_survive_the_migration(self):
+        record = PatientRecord(7, True)
+        self.assertEqual(record.get_note_by_id(2).text, "legacy two")
+        self.assertEqual(note_rows(record.get_notes_list()), [(1, "legacy one"), (2, "legacy two")])
+        self.assertEqual(record.add_note("after upgrade").code, 3)
+
+        expected = [(1, "legacy one"), (2, "legacy two"), (3, "after upgrade")]
+        call_command("migrate_notes", stdout=io.StringIO())
+        self.assertEqual(note_rows(PatientRecord(7, True).get_notes_list()), expected)
+        call_command("migrate_notes", "--overwrite", stdout=io.StringIO())
+        self.assertEqual(note_rows(PatientRecord(7, True).get_notes_list()), expected)
+
+
+class AsyncViewAuthenticationTest(TestCase):
+    """ the async views admit the same users as the DRF views"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.working_directory = os.getcwd()
+        os.makedirs(os.path.join(self.directory.name, "clinic", "records"))
+        os.chdir(self.directory.name)
+        self.user = User.objects.create_user("async", password="pw12345!")
+        self.headers = {"HTTP_AUTHORIZATION": f"Bearer {RefreshToken.for_user(self.user).access_token}"}
+
+    def tearDown(self):
+        os.chdir(self.working_directory)
+        self.directory.cleanup()
+
+    def test_inactive_and_deleted_users_are_rejected(self):
+        self.assertEqual(self.client.get("/api/async/patients/", **self.headers).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get("/api/patients/", **self.headers).status_code, 401)
+        self.assertEqual(self.client.get("/api/async/patients/", **self.headers).status_code, 401)
+        self.assertEqual(self.client.delete("/api/async/patients/1/delete/", **self.headers).status_code, 401)
+        self.user.delete()
+        self.assertEqual(self.client.get("/api/async/patients/", **self.headers).status_code, 401)
+
+
+class PatientJSONTest(TestCase):
+    """ Patient.to_json renders exactly what DRF renders for PatientSerializer"""
+
+    def test_matches_the_serializer(self):
+        patients = [Patient(*row) for row in PARITY_PATIENTS] + [
+            Patient(2001, "No Contact", None, None, None, None),
+            Patient(2002, "Line\u2028Separator </script>", "1990-01-01", "", "", "Apt 1\n2 Main St"),
+        ]
+        for patient in patients:
+            self.assertEqual(patient.to_json(), JSONRenderer().render(PatientSerializer(patient).data))
+
+
+    def test_patient_records_stay_public(self):
+        patient = Patient(*PARITY_PATIENTS[0])
+        self.assertIs(patient.patient_records, patient.get_patient_records())
+
+
+class PatientVersionTest(TestCase):
+    """ processes holding the same saved patients give the same version token, so any of them can answer 304"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.working_directory = os.getcwd()
+        os.makedirs(os.path.join(self.directory.name, "clinic", "records"))
+        os.chdir(self.directory.name)
+
+    def tearDown(self):
+        os.chdir(self.working_directory)
+        self.directory.cleanup()
+
+    def test_stores_sharing_the_files_share_the_token(self):
+        for journal in (False, True):
+            writer = PatientDAOJSON(autosave=True, journal=journal)
+            reader = PatientDAOJSON(autosave=True, journal=journal)
+            token = writer.version()[0]
+            self.assertEqual(reader.version()[0], token)
+
+            writer.create_patient(Patient(len(writer.patients) + 1, "Ann Lee", "1990-01-01", "", "", ""))
+            self.assertNotEqual(writer.version()[0], token)
+            self.assertEqual(reader.version()[0], writer.version()[0])
+            self.assertEqual(PatientDAOJSON(autosave=True, journal=journal).version()[0], writer.version()[0])
+
+
+class NoteSearchTest(TestCase):
+    """ note searches without words keep the substring search and creation order they always had"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        database = SQLiteDatabase(os.path.join(self.directory.name, "clinic.sqlite3"))
+        self.daos = [NoteDAOPickle("7", False), NoteDAOSQLite("7", database)]
+        for dao in self.daos:
+            for text in ["Blood pressure fine!!", "Follow up in two weeks", "Allergy: penicillin!!"]:
+                dao.create_note(text)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_queries_without_words(self):
+        for dao in self.daos:
+            self.assertEqual([note.code for note in dao.retrieve_notes("")], [1, 2, 3])
+            self.assertEqual([note.code for note in dao.retrieve_notes("!!")], [1, 3])
+            self.assertEqual([note.code for note in dao.retrieve_notes("!!", 1)], [1])
+            self.assertEqual(dao.retrieve_notes("?"), [])
+            self.assertEqual([note.code for note in dao.retrieve_notes("follow")], [2])
@@ -0,0 +1,46 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenCache:
+    def __init__(self, maxsize = 1024, ttl = 300) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def signature(token: str) -> str:
+        """ returns the signature segment of a JWT"""
+        return token.rsplit(".", 1)[-1]
+
+    def get_user_id(self, token: str):
+        """ returns the user id of a token validated before that has not expired since, otherwise None"""
+        key = self.signature(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            cached_token, expires_at, user_id = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+        # the signature alone is only the key, a different payload under a copied signature must not match
+        return user_id if cached_token == token else None
+
+    def is_valid(self, token: str) -> bool:
+        """ returns true if token was validated before and has not expired since"""
+        return self.get_user_id(token) is not None
+
+    def add(self, token: str, exp: float, user_id) -> None:
+        """ remembers a validated token until its exp claim or the cache TTL, whichever comes first"""
+        expires_at = min(exp, time.time() + self.ttl)
+        with self._lock:
+            self._entries[self.signature(token)] = (token, expires_at, user_id)
+            self._entries.move_to_end(self.signature(token))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
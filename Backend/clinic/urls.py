@@ -1,6 +1,7 @@
 from django.urls import path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from .views import login, logout, get_patients, create_patient, delete_patient, set_current_patient, get_current_patient, unset_current_patient, search_patients, update_patient
+from . import async_views
+from .views import login, logout, get_patients, create_patient, delete_patient, set_current_patient, get_current_patient, unset_current_patient, search_patients, autocomplete_patients, update_patient, note_store_stats, search_cache_stats, import_patients, export_records
 
 urlpatterns = [
     path("token/", TokenObtainPairView.as_view(), name='token_obtain_pair'),
@@ -9,10 +10,22 @@ urlpatterns = [
     path("logout/", logout, name="logout"),
     path("patients/", get_patients, name="get_patients"),
     path("patients/create/", create_patient, name="create_patient"),
+    path("patients/import/", import_patients, name="import_patients"),
     path("patients/<int:phn>/delete/", delete_patient, name="delete_patient"),
     path("patients/<int:phn>/set-current/", set_current_patient, name="set_current_patient"),
     path("patients/current/", get_current_patient, name="get_current_patient"),
     path("patients/unset-current/", unset_current_patient, name="unset_current_patient"),
     path("patients/search/", search_patients, name="search_patients"),
+    path("patients/autocomplete/", autocomplete_patients, name="autocomplete_patients"),
     path("patients/<int:original_phn>/update/", update_patient, name="update_patient"),
+    path("stats/note-stores/", note_store_stats, name="note_store_stats"),
+    path("stats/search-cache/", search_cache_stats, name="search_cache_stats"),
+    path("export/", export_records, name="export_records"),
+    # async variants for ASGI servers, storage I/O runs on the controller's executor
+    path("async/patients/", async_views.get_patients, name="async_get_patients"),
+    path("async/patients/create/", async_views.create_patient, name="async_create_patient"),
+    path("async/patients/<int:phn>/delete/", async_views.delete_patient, name="async_delete_patient"),
+    path("async/patients/search/", async_views.search_patients, name="async_search_patients"),
+    path("async/patients/autocomplete/", async_views.autocomplete_patients, name="async_autocomplete_patients"),
+    path("async/patients/<int:original_phn>/update/", async_views.update_patient, name="async_update_patient"),
 ]
@@ -7,16 +7,139 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from clinic.controller import Controller
 from clinic.serializers import PatientSerializer
+from clinic.patient_import import read_csv, read_ndjson
+from clinic.patient_export import ndjson_chunks, gzip_chunks
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from clinic.patient import JSON_ENCODER
+from clinic.exception.no_current_patient_exception import NoCurrentPatientException
 from rest_framework import pagination
 from rest_framework.pagination import PageNumberPagination
 from rest_framework import status
+from django.conf import settings
+from datetime import date
+from functools import wraps
+import base64
+import hashlib
+import json
+
+def patients_json(patients) -> bytes:
+    """Render patients as a JSON array by joining their cached renderings"""
+    return b"[" + b",".join(patient.to_json() for patient in patients) + b"]"
+
+
+def json_response(data: dict, results: list) -> HttpResponse:
+    """Render data with the patients' cached renderings as its final results member, matching what DRF would render"""
+    head = JSON_ENCODER.encode(data).encode("utf-8")
+    return HttpResponse(head[:-1] + b',"results":' + patients_json(results) + b"}", content_type="application/json")
+
+
+def listing_validators(request, version: tuple) -> tuple:
+    """Return the ETag and Last-Modified time of a patient listing, which change with the patients' version and with the URL"""
+    token, modified = version
+    # the URL includes the host, since the pagination links in the body do
+    digest = hashlib.blake2b(f"{token} {request.build_absolute_uri()}".encode(), digest_size=16).hexdigest()
+    return f'"{digest}"', int(modified)
+
+
+def set_validators(response, etag: str, last_modified: int):
+    """Add the listing's validators to a successful or not modified response"""
+    if response.status_code in (200, 304):
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def conditional_listing(view):
+    """Answer a matching If-None-Match with 304 before the view reads or renders any patient"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            etag, last_modified = listing_validators(request, controller.patients_version(request))
+        except Exception:
+            return view(request, *args, **kwargs)
+
+        # Last-Modified only has second precision, so only the strong ETag decides, the header is still sent
+        response = get_conditional_response(request, etag=etag, last_modified=None)
+        if response is not None:
+            return set_validators(response, etag, last_modified)
+        return set_validators(view(request, *args, **kwargs), etag, last_modified)
+    return wrapper
+
 
 class PatientPagination(PageNumberPagination):
     page_size = 100
     page_size_query_param = 'page_size'
     max_page_size = 100
 
-controller = Controller(autosave=True)
+    def get_fragment_response(self, patients: list) -> HttpResponse:
+        return json_response({
+            'count': self.page.paginator.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        }, patients)
+
+def patient_filters(request) -> dict:
+    """Return the phone, email and inclusive ISO birth date bounds asked for in the query string"""
+    filters = {param: request.GET[param] for param in ('phone', 'email') if param in request.GET}
+    for param in ('birth_date_after', 'birth_date_before'):
+        if param in request.GET:
+            filters[param] = date.fromisoformat(request.GET[param]).isoformat()
+    return filters
+
+def autocomplete_limit(request) -> int:
+    """Return the requested number of suggestions, 10 by default and at most 50"""
+    limit = min(int(request.GET.get('limit', 10)), 50)
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return limit
+
+class PatientCursorPagination:
+    """Keyset pagination: the opaque cursor holds the sort key of the last patient already returned"""
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+
+    def __init__(self, request, key) -> None:
+        self.key = key
+        self.page_size = min(int(request.GET.get(self.page_size_query_param, self.page_size)), self.max_page_size)
+        if self.page_size < 1:
+            raise ValueError("page_size must be positive")
+
+        cursor = request.GET.get(self.cursor_query_param)
+        self.after = self.decode_cursor(cursor) if cursor else None
+
+    @staticmethod
+    def encode_cursor(key) -> str:
+        return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str):
+        try:
+            key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except ValueError:
+            raise ValueError("Invalid cursor.")
+        return tuple(key) if isinstance(key, list) else key
+
+    def get_paginated_response(self, patients: list) -> HttpResponse:
+        """Expects up to page_size + 1 patients; the extra one only signals that another page exists"""
+        page = patients[:self.page_size]
+        next_cursor = self.encode_cursor(self.key(page[-1])) if len(patients) > self.page_size else None
+        return json_response({'next': next_cursor}, page)
+
+controller = Controller(
+    autosave=True,
+    journal=settings.CLINIC_STORAGE['JOURNAL'],
+    write_behind=settings.CLINIC_STORAGE['WRITE_BEHIND'],
+    backend=settings.CLINIC_STORAGE['BACKEND'],
+    database_path=settings.CLINIC_STORAGE['SQLITE_PATH'],
+    session_backend=settings.CLINIC_SESSIONS['BACKEND'],
+    session_path=settings.CLINIC_SESSIONS['SQLITE_PATH'],
+    session_ttl=settings.CLINIC_SESSIONS['TTL'],
+    async_workers=settings.CLINIC_STORAGE['ASYNC_WORKERS'],
+)
 
 @api_view(['POST'])
 @permission_classes([AllowAny])  # Allow all users to call this endpoint
@@ -48,34 +171,67 @@ def logout(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_listing
 def get_patients(request):
-    """Retrieve patients with pagination & backend search"""
+    """Retrieve patients with pagination & backend search, optionally by phone, email or birth date range"""
     try:
-        patients = controller.list_patients(request)
-
+        filters = patient_filters(request)
+        if filters:
+            if PatientCursorPagination.cursor_query_param in request.GET:
+                raise ValueError("Phone, email and birth date filters use page numbers, not cursors.")
+            patients = controller.filter_patients(request, **filters)
+        elif PatientCursorPagination.cursor_query_param in request.GET:
+            paginator = PatientCursorPagination(request, key=lambda patient: patient.phn)
+            patients = controller.list_patients_page(request, paginator.after, paginator.page_size + 1)
+            return paginator.get_paginated_response(patients)
+        else:
+            patients = controller.list_patients(request)
 
         paginator = PatientPagination()
         paginated_patients = paginator.paginate_queryset(patients, request)
 
-        serializer = PatientSerializer(paginated_patients, many=True)
-        return paginator.get_paginated_response(serializer.data)
+        return paginator.get_fragment_response(paginated_patients)
     except Exception as e:
         return Response({'error': str(e)}, status=400)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_listing
 def search_patients(request):
-    """Search patients by name with pagination"""
+    """Search patients by name with pagination, by substring or with mode=fuzzy by similarity"""
     try:
         search_query = request.GET.get('search', '')
-        patients = controller.retrieve_patients(request, search_query)
+        mode = request.GET.get('mode', 'substring')
+        if mode not in ('substring', 'fuzzy'):
+            raise ValueError(f"Unknown search mode: {mode}")
+        if mode == 'fuzzy':
+            # ranked by similarity, so only page numbers apply
+            patients = controller.retrieve_patients_fuzzy(request, search_query)
+        elif PatientCursorPagination.cursor_query_param in request.GET:
+            paginator = PatientCursorPagination(request, key=lambda patient: [patient.name.casefold(), patient.phn])
+            patients = controller.retrieve_patients_page(request, search_query, paginator.after, paginator.page_size + 1)
+            return paginator.get_paginated_response(patients)
+        else:
+            patients = controller.retrieve_patients(request, search_query)
 
         paginator = PatientPagination()
         paginated_patients = paginator.paginate_queryset(patients, request)
-        serializer = PatientSerializer(paginated_patients, many=True)
 
-        return paginator.get_paginated_response(serializer.data)
+        return paginator.get_fragment_response(paginated_patients)
+    except Exception as e:
+        return Response({'error': str(e)}, status=400)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@conditional_listing
+def autocomplete_patients(request):
+    """Suggest patients whose name starts with the typed prefix, echoing the prefix so late answers can be dropped"""
+    try:
+        prefix = request.GET.get('prefix', '')
+        patients = controller.autocomplete(request, prefix, autocomplete_limit(request))
+        return json_response({'prefix': prefix}, patients)
     except Exception as e:
         return Response({'error': str(e)}, status=400)
 
@@ -100,6 +256,43 @@ def create_patient(request):
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def import_patients(request):
+    """Import patients from an NDJSON or CSV (text/csv) body, reading it line by line and saving once"""
+    try:
+        lines = request.stream or []
+        # the header may carry parameters such as "text/csv; charset=utf-8", only the media type decides
+        if request.content_type.split(';')[0].strip() == 'text/csv':
+            rows = read_csv(lines)
+        else:
+            rows = read_ndjson(lines)
+
+        result = controller.import_patients(request, rows)
+        if result['created']:
+            return Response(result, status=status.HTTP_201_CREATED)
+        return Response(result, status=status.HTTP_400_BAD_REQUEST if result['failed'] else status.HTTP_200_OK)
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def export_records(request):
+    """Stream every patient followed by their notes as NDJSON, gzip compressed with ?compress=gzip"""
+    try:
+        chunks = ndjson_chunks(controller.export_records(request))
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    filename = "clinic-export.ndjson"
+    if request.GET.get('compress') == 'gzip':
+        response = StreamingHttpResponse(gzip_chunks(chunks), content_type='application/gzip')
+        filename += ".gz"
+    else:
+        response = StreamingHttpResponse(chunks, content_type='application/x-ndjson')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 @api_view(["PUT"])
 @permission_classes([IsAuthenticated])
 def update_patient(request, original_phn):
@@ -154,7 +347,7 @@ def delete_patient(request, phn):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def set_current_patient(request, phn):
-    """Set a patient as the current patient (stored in memory)"""
+    """Set a patient as the current patient of the requesting user"""
     try:
         controller.set_current_patient(request, int(phn))
         return Response({"message": f"Patient {phn} set as current patient"}, status=200)
@@ -165,13 +358,12 @@ def set_current_patient(request, phn):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_current_patient(request):
-    """Retrieve the current patient from the controller."""
+    """Retrieve the current patient of the requesting user from the controller."""
     try:
-        if controller._patient is None:
-            return Response({"error": "No current patient set"}, status=404)  # Change 400 to 404
-
-        serializer = PatientSerializer(controller._patient)
+        serializer = PatientSerializer(controller.get_current_patient(request))
         return Response(serializer.data, status=200)
+    except NoCurrentPatientException:
+        return Response({"error": "No current patient set"}, status=404)  # Change 400 to 404
     except Exception as e:
         return Response({"error": str(e)}, status=400)
 
@@ -179,7 +371,7 @@ def get_current_patient(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def unset_current_patient(request):
-    """Unset the current patient (clear from memory)"""
+    """Unset the current patient of the requesting user"""
     try:
         controller.unset_current_patient(request)
         return Response({"message": "Current patient unset"}, status=200)
@@ -187,4 +379,24 @@ def unset_current_patient(request):
         return Response({"error": str(e)}, status=400)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def note_store_stats(request):
+    """Report hit, miss and eviction counters of the note store cache"""
+    try:
+        return Response(controller.note_store_stats(request), status=200)
+    except Exception as e:
+        return Response({"error": str(e)}, status=400)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_cache_stats(request):
+    """Report hit, prefix hit, miss and invalidation counters of the patient search cache"""
+    try:
+        return Response(controller.search_cache_stats(request), status=200)
+    except Exception as e:
+        return Response({"error": str(e)}, status=400)
+
+
 
@@ -36,6 +36,23 @@ SIMPLE_JWT = {
     'SIGNING_KEY': SECRET_KEY,  # Uses Django's secret key for signing tokens
     'AUTH_HEADER_TYPES': ('Bearer',),  # Use Bearer Token in requests
 }
+# Patient and note storage. "json" keeps patients.json plus one note file per
+# patient; "sqlite" keeps both in a single SQLite database at SQLITE_PATH.
+CLINIC_STORAGE = {
+    'BACKEND': 'json',
+    'JOURNAL': True,
+    'WRITE_BEHIND': True,
+    'SQLITE_PATH': BASE_DIR / 'clinic' / 'clinic.sqlite3',
+    'ASYNC_WORKERS': 8,  # threads the async views use for blocking storage calls
+}
+
+# Current patient per user. 'sqlite' shares it between worker processes, 'memory' keeps it per process.
+CLINIC_SESSIONS = {
+    'BACKEND': 'sqlite',
+    'SQLITE_PATH': BASE_DIR / 'clinic' / 'sessions.sqlite3',
+    'TTL': 8 * 60 * 60,  # seconds
+}
+
 # Application definition
 INSTALLED_APPS = [
     'django.contrib.admin',